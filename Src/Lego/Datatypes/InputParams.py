@@ -3,15 +3,81 @@ InputParams used for dynamic form input generation.
 
 """
 
-from marshmallow import Schema, fields, validate
+from marshmallow import Schema, ValidationError, fields, validate
+
+def _as_messages(exp):
+    messages = exp.messages
+    return list(messages) if isinstance(messages, (list, tuple)) else [messages]
+
+def _fast_check(validator):
+    """
+    Returns a predicate equivalent to a marshmallow validator for valid values, None if the
+    validator has no fast equivalent.
+
+    """
+    if isinstance(validator, validate.Range):
+        low, high = validator.min, validator.max
+        return lambda value: (low is None or value >= low) and (high is None or value <= high)
+    if isinstance(validator, validate.Length) and getattr(validator, 'equal', None) is None:
+        low, high = validator.min, validator.max
+        return lambda value: ((low is None or len(value) >= low) and
+                              (high is None or len(value) <= high))
+    if isinstance(validator, validate.OneOf):
+        try:
+            choices = frozenset(validator.choices)
+        except TypeError:
+            choices = validator.choices
+        return lambda value: value in choices
+    return None
+
+def _compile_field(field, python_type, validators):
+    """
+    Compiles the checks of a field into a function returning the error messages of a value.
+
+    Values of the expected python type that pass every check never reach marshmallow. Anything
+    else is handed to the marshmallow field and validators, so conversions and error messages
+    stay the same.
+
+    """
+    checks = [(validator, _fast_check(validator)) for validator in validators]
+
+    def check_field(value):
+        if type(value) is not python_type:
+            try:
+                value = field.deserialize(value)
+            except ValidationError as exp:
+                return _as_messages(exp)
+        messages = []
+        for validator, fast in checks:
+            if fast is not None:
+                try:
+                    if fast(value):
+                        continue
+                except TypeError:
+                    pass
+            try:
+                if validator(value) is False:
+                    messages.append(field.error_messages.get('validator_failed',
+                                                             'Invalid value.'))
+            except ValidationError as exp:
+                messages.extend(_as_messages(exp))
+        return messages
+    return check_field
 
 class InputParams():
     """
     Defines the datatype schema generation on the fly.
 
+    Generated schemas are cached until a field is added, fields must be added through the add_*
+    methods for the cache to notice.
+
     """
     def __init__(self):
         self.data_definition = {}
+        self.python_types = {}
+        self.version = 0
+        self.schemas = {}
+        self.validator = None
 
     def add_integer_field(self, name, validation, required=False):
         """
@@ -19,6 +85,8 @@ class InputParams():
 
         """
         self.data_definition[name] = fields.Integer(validate=validation, required=required)
+        self.python_types[name] = int
+        self.version += 1
 
     def get_integer_range_validation(self, min_value, max_value):
         """
@@ -33,6 +101,8 @@ class InputParams():
 
         """
         self.data_definition[name] = fields.String(validate=validation, required=required)
+        self.python_types[name] = str
+        self.version += 1
 
     def get_string_length_validation(self, min_length, max_length):
         """
@@ -50,8 +120,61 @@ class InputParams():
 
     def generate_schema(self, schema_name):
         """
-        Generates the schema as a class from the data definition.
+        Generates the schema as a class from the data definition, once per version of it.
 
         """
-        dyn_schema = type(schema_name, (Schema,), self.data_definition)
+        cached = self.schemas.get(schema_name)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+        dyn_schema = type(schema_name, (Schema,), dict(self.data_definition))
+        self.schemas[schema_name] = (self.version, dyn_schema)
         return dyn_schema
+
+    def compile_validator(self):
+        """
+        Compiles the data definition into a function validating a dict of input values, it
+        returns the errors by field name as marshmallow Schema.validate does. The function is
+        compiled once per version of the data definition.
+
+        """
+        if self.validator is not None and self.validator[0] == self.version:
+            return self.validator[1]
+        compiled = []
+        for name, field in self.data_definition.items():
+            validators = field.validate
+            if validators is None:
+                validators = []
+            elif callable(validators):
+                validators = [validators]
+            compiled.append((name, field.required, field.error_messages['required'],
+                             _compile_field(field, self.python_types.get(name), validators)))
+
+        def validator(data):
+            errors = {}
+            for name, required, missing, check_field in compiled:
+                if name not in data:
+                    if required:
+                        errors[name] = [missing]
+                    continue
+                messages = check_field(data[name])
+                if messages:
+                    errors[name] = messages
+            return errors
+
+        self.validator = (self.version, validator)
+        return validator
+
+    def validate(self, data):
+        """
+        Validates a dict of input values, returns the errors by field name.
+
+        """
+        return self.compile_validator()(data)
+
+    def validate_many(self, datas):
+        """
+        Validates many dicts of input values, returns the errors of each one.
+
+        """
+        validator = self.compile_validator()
+        return [validator(data) for data in datas]
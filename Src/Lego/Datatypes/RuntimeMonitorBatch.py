@@ -0,0 +1,230 @@
+"""
+Columnar container for many deserialized RuntimeMonitorParams objects.
+
+"""
+import array
+import struct
+from collections.abc import Sequence
+
+from Lego.Datatypes.RuntimeMonitorCodec import ARRAY_TYPECODES, STRUCT_KINDS
+
+class StringColumn(Sequence):
+    """
+    Column of C strings kept as their fixed width NUL padded bytes, decoded on access.
+
+    """
+    def __init__(self, width):
+        """
+        Builds an empty column of strings of at most width bytes.
+
+        """
+        self.width = width
+        self.data = bytearray()
+
+    def append(self, value):
+        """
+        Appends a string or its encoded bytes.
+
+        """
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        self.data += value[:self.width].ljust(self.width, b'\0')
+
+    def get_bytes(self, index):
+        """
+        Returns the padded bytes of string at index without decoding them.
+
+        """
+        offset = index * self.width
+        return bytes(self.data[offset:offset + self.width])
+
+    def __len__(self):
+        return len(self.data) // self.width
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('String column index out of range')
+        return self.get_bytes(index).partition(b'\0')[0].decode('utf-8')
+
+class FieldColumn(StringColumn):
+    """
+    Column of array or nested struct fields kept as their raw bytes, decoded on access by the
+    codec of the field.
+
+    """
+    def __init__(self, field_codec):
+        """
+        Builds an empty column for the fields of a codec.
+
+        """
+        super(FieldColumn, self).__init__(field_codec.nbytes)
+        self.field_codec = field_codec
+
+    def append(self, value):
+        """
+        Appends a field value or its raw bytes.
+
+        """
+        self.data += bytes(self.field_codec.encode(value)).ljust(self.width, b'\0')
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('Field column index out of range')
+        return self.field_codec.decode(self.get_bytes(index))
+
+class RuntimeMonitorBatch(Sequence):
+    """
+    Objects of one layout stored field by field, numbers in array.array columns and strings in
+    fixed width byte columns, so a batch costs about the size of its records instead of one
+    Python object per field of every record. Array and nested struct fields keep their raw
+    bytes.
+
+    Rows are views created on access, their fields are read from the columns when asked.
+
+    """
+    # Records decoded at a time while extending, bounds the temporary tuples.
+    BLOCK_SIZE = 4096
+
+    def __init__(self, monitor):
+        """
+        Builds an empty batch for the layout of monitor.
+
+        """
+        self.codec = monitor.compile()
+        self.var_names = self.codec.var_names
+        byte_order = monitor.type_def[0]
+        self.columns = []
+        for position, field_format in enumerate(monitor.field_formats):
+            if position in self.codec.field_codecs:
+                self.columns.append(FieldColumn(self.codec.field_codecs[position]))
+            elif position in self.codec.string_positions:
+                self.columns.append(StringColumn(struct.calcsize(field_format)))
+            else:
+                size = struct.calcsize(byte_order + field_format)
+                typecode = ARRAY_TYPECODES[STRUCT_KINDS[field_format[-1]]][size]
+                self.columns.append(array.array(typecode))
+        self.by_name = dict(zip(self.var_names, self.columns))
+        self.row_type = _row_type(self.var_names)
+
+    def append(self, obj):
+        """
+        Appends an object given as a tuple of its field values.
+
+        """
+        for column, value in zip(self.columns, obj):
+            column.append(value)
+
+    def _extend_values(self, rows):
+        for column, values in zip(self.columns, zip(*rows)):
+            if isinstance(column, array.array):
+                column.extend(values)
+            else:
+                for value in values:
+                    column.append(value)
+
+    def extend(self, obj, count=-1, offset=0):
+        """
+        Appends serialized objects. Accepts a buffer of consecutive objects or a sequence with
+        get_chunks such as Shmem records, Shmem frames or capture file records, which are
+        decoded block by block. Strings are copied without being decoded.
+
+        """
+        compiled = self.codec.compiled
+        size = self.codec.size
+        if not self.columns:
+            return self
+        if hasattr(obj, 'get_chunks'):
+            chunks = obj.get_chunks()
+        else:
+            if count < 0:
+                count = (len(memoryview(obj).cast('B')) - offset) // size
+            chunks = [(obj, offset, count, size)]
+        for buffer, chunk_offset, chunk_count, stride in chunks:
+            view = memoryview(buffer).cast('B')
+            for first in range(0, chunk_count, self.BLOCK_SIZE):
+                block_count = min(self.BLOCK_SIZE, chunk_count - first)
+                block_offset = chunk_offset + first * stride
+                if stride == size:
+                    rows = list(compiled.iter_unpack(
+                        view[block_offset:block_offset + block_count * size]))
+                else:
+                    rows = [compiled.unpack_from(view, block_offset + index * stride)
+                            for index in range(block_count)]
+                self._extend_values(rows)
+        return self
+
+    def get_column(self, name):
+        """
+        Returns the column of a field, an array.array for numbers, a StringColumn for strings
+        and a FieldColumn for arrays and nested structs.
+
+        """
+        return self.by_name[name]
+
+    def get_record(self, index):
+        """
+        Returns the object at index decoded like RuntimeMonitorParams.deserialize does.
+
+        """
+        return self.codec.record_type(*(column[index] for column in self.columns))
+
+    def nbytes(self):
+        """
+        Returns the bytes held by the columns.
+
+        """
+        return sum(len(column.data) if isinstance(column, StringColumn) else
+                   column.itemsize * len(column) for column in self.columns)
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('Batch index out of range')
+        return self.row_type(self, index)
+
+    def __repr__(self):
+        return ('RuntimeMonitorBatch(' + str(len(self)) + ' objects, ' + str(self.nbytes()) +
+                ' bytes)')
+
+def _row_type(var_names):
+    """
+    Returns a row view class with a property per field of the layout, its slots are prefixed
+    so they never shadow a field.
+
+    """
+    def field(column_position):
+        return property(lambda row: row._batch.columns[column_position][row._index])
+
+    namespace = {'__slots__': ('_batch', '_index'), '__init__': _row_init,
+                 'materialize': _row_materialize, '__repr__': _row_repr}
+    for position, name in enumerate(var_names):
+        namespace[name] = field(position)
+    return type('RuntimeMonitorRow', (), namespace)
+
+def _row_init(row, batch, index):
+    row._batch = batch
+    row._index = index
+
+def _row_materialize(row):
+    """
+    Returns the row decoded like RuntimeMonitorParams.deserialize does.
+
+    """
+    return row._batch.get_record(row._index)
+
+def _row_repr(row):
+    return repr(row.materialize())
@@ -0,0 +1,243 @@
+"""
+Compiled codec for a frozen RuntimeMonitorParams layout.
+
+"""
+import re
+import sys
+import array
+import struct
+from collections import namedtuple
+
+ARRAY_TYPECODES = {
+    'i': {1: 'b', 2: 'h', 4: 'i', 8: 'q'},
+    'u': {1: 'B', 2: 'H', 4: 'I', 8: 'Q'},
+    'f': {4: 'f', 8: 'd'},
+}
+STRUCT_KINDS = {
+    'b': 'i', 'h': 'i', 'i': 'i', 'l': 'i', 'q': 'i',
+    'B': 'u', 'H': 'u', 'I': 'u', 'L': 'u', 'Q': 'u', 'P': 'u', '?': 'u',
+    'f': 'f', 'd': 'f',
+}
+
+class ArrayFieldCodec:
+    """
+    Codec of a fixed size array field, kept in the record struct as raw bytes. Arrays decode to
+    a memoryview of their elements, or to an array.array when the byte order of the layout is
+    not the native one.
+
+    """
+    def __init__(self, byte_order, code, length):
+        """
+        Describes length elements of struct format code.
+
+        """
+        self.code = code
+        self.length = length
+        self.packer = struct.Struct(byte_order + str(length) + code)
+        self.nbytes = self.packer.size
+        self.itemsize = struct.calcsize(byte_order + code)
+        self.kind = STRUCT_KINDS[code]
+        self.typecode = code if code == '?' else ARRAY_TYPECODES[self.kind][self.itemsize]
+        swapped = byte_order in '<>!' and byte_order != {'little': '<', 'big': '>'}[sys.byteorder]
+        self.native = not swapped
+
+    def encode(self, value):
+        """
+        Returns the bytes of an array given as raw bytes, a buffer of its elements such as a
+        memoryview, array.array or NumPy array, or any sequence of numbers.
+
+        """
+        if isinstance(value, (bytes, bytearray)) and len(value) == self.nbytes:
+            return value
+        try:
+            view = memoryview(value)
+        except TypeError:
+            return self.packer.pack(*value)
+        element = view.format.lstrip('@=')
+        if (self.native and STRUCT_KINDS.get(element) == self.kind and
+                view.itemsize == self.itemsize and view.nbytes == self.nbytes and
+                view.c_contiguous):
+            return view.tobytes()
+        return self.packer.pack(*view.tolist())
+
+    def decode(self, raw):
+        """
+        Returns the elements held by the raw bytes of the array.
+
+        """
+        if self.native:
+            return memoryview(raw).cast('B').cast(self.typecode)
+        elements = array.array(self.typecode, raw)
+        elements.byteswap()
+        return elements
+
+    def view(self, buffer, offset):
+        """
+        Returns the elements of the array at offset in buffer, without copying them when the
+        layout has the native byte order.
+
+        """
+        raw = memoryview(buffer).cast('B')[offset:offset + self.nbytes]
+        return self.decode(raw if self.native else bytes(raw))
+
+class StructFieldCodec:
+    """
+    Codec of a nested struct field, kept in the record struct as raw bytes including the
+    trailing padding of the nested struct.
+
+    """
+    def __init__(self, monitor, nbytes):
+        """
+        Describes a struct of the layout of monitor taking nbytes in the record.
+
+        """
+        self.monitor = monitor
+        self.codec = monitor.compile()
+        self.nbytes = nbytes
+
+    def encode(self, value):
+        """
+        Returns the bytes of the nested object, given as a tuple of its fields or raw bytes.
+
+        """
+        if isinstance(value, (bytes, bytearray)) and len(value) == self.nbytes:
+            return value
+        return self.codec.pack(value)
+
+    def decode(self, raw):
+        """
+        Returns the nested object held by the raw bytes.
+
+        """
+        return self.codec.unpack_from(raw)
+
+    def view(self, buffer, offset):
+        """
+        Returns the nested object at offset in buffer, its arrays are views of buffer.
+
+        """
+        return self.codec.unpack_from(buffer, offset)
+
+class RuntimeMonitorCodec:
+    """
+    Packs and unpacks objects of one layout with a precompiled struct and decoders generated
+    for that layout, so no format string is parsed and no intermediate dict is built per object.
+
+    """
+    def __init__(self, type_def, var_names, string_positions, field_codecs=None):
+        """
+        Compiles the layout, it must not change afterwards. Array and nested struct fields are
+        raw bytes in the type definition, field_codecs maps their positions to their codecs.
+
+        """
+        self.type_def = type_def
+        self.var_names = tuple(var_names)
+        self.string_positions = tuple(string_positions)
+        self.field_codecs = dict(field_codecs or {})
+        self.compiled = struct.Struct(type_def)
+        self.size = self.compiled.size
+        self.record_type = namedtuple('RuntimeMonitorParamsDeserialized',
+                                      field_names=self.var_names)
+        self._generate()
+
+    def _generate(self):
+        """
+        Generates pack and unpack functions specialized for the string positions of the layout.
+
+        """
+        if not self.var_names:
+            # An empty layout packs to no bytes and unpacks to an empty record.
+            self.pack = lambda obj: b''
+            self.pack_into = lambda buffer, offset, obj: None
+            self.decode = lambda values: self.record_type()
+            self.unpack_from = lambda buffer, offset=0: self.record_type()
+            return
+        values = ['v' + str(position) for position in range(len(self.var_names))]
+        unpacked = ', '.join(values) + ','
+        encoded = ', '.join(value + '.encode()' if position in self.string_positions else
+                            '_encode' + value + '(' + value + ')'
+                            if position in self.field_codecs else value
+                            for position, value in enumerate(values))
+        decoded = ', '.join(value + ".partition(b'\\0')[0].decode('utf-8')"
+                            if position in self.string_positions else
+                            '_decode' + value + '(' + value + ')'
+                            if position in self.field_codecs else value
+                            for position, value in enumerate(values))
+        namespace = {
+            '_pack': self.compiled.pack,
+            '_pack_into': self.compiled.pack_into,
+            '_record': self.record_type,
+        }
+        # Array and struct fields are skipped when unpacking in place and viewed instead.
+        scalars = [value for position, value in enumerate(values)
+                   if position not in self.field_codecs]
+        in_place = ['    ' + ', '.join(scalars) + ', = _unpack_scalars(buffer, offset)'
+                    if scalars else '']
+        if self.field_codecs:
+            scalar_def, offsets = self._get_scalar_layout()
+            namespace['_unpack_scalars'] = struct.Struct(scalar_def).unpack_from
+            for position, field_codec in self.field_codecs.items():
+                value = values[position]
+                namespace['_encode' + value] = field_codec.encode
+                namespace['_decode' + value] = field_codec.decode
+                namespace['_view' + value] = field_codec.view
+                in_place.append('    ' + value + ' = _view' + value + '(buffer, offset + ' +
+                                str(offsets[position]) + ')')
+        else:
+            namespace['_unpack_scalars'] = self.compiled.unpack_from
+        in_place_decoded = ', '.join(value + ".partition(b'\\0')[0].decode('utf-8')"
+                                     if position in self.string_positions else value
+                                     for position, value in enumerate(values))
+        source = '\n'.join([
+            'def pack(obj):',
+            '    ' + unpacked + ' = obj',
+            '    return _pack(' + encoded + ')',
+            'def pack_into(buffer, offset, obj):',
+            '    ' + unpacked + ' = obj',
+            '    _pack_into(buffer, offset, ' + encoded + ')',
+            'def decode(values):',
+            '    ' + unpacked + ' = values',
+            '    return _record(' + decoded + ')',
+            'def unpack_from(buffer, offset=0):',
+        ] + [line for line in in_place if line] + [
+            '    return _record(' + in_place_decoded + ')',
+        ])
+        exec(compile(source, '<RuntimeMonitorCodec ' + self.type_def + '>', 'exec'), namespace)
+        self.pack = namespace['pack']
+        self.pack_into = namespace['pack_into']
+        self.decode = namespace['decode']
+        self.unpack_from = namespace['unpack_from']
+
+    def _get_scalar_layout(self):
+        """
+        Returns the type definition with array and struct fields turned into padding, and the
+        offset of every field.
+
+        """
+        byte_order = self.type_def[0]
+        tokens = re.findall(r'\d*[a-zA-Z?]', self.type_def[1:])
+        scalar_tokens, offsets = [], []
+        for token in tokens:
+            size = struct.calcsize(byte_order + token)
+            end = struct.calcsize(byte_order + ''.join(scalar_tokens) + token)
+            if token.endswith('x'):
+                scalar_tokens.append(token)
+                continue
+            if len(offsets) in self.field_codecs:
+                token = token[:-1] + 'x'
+            offsets.append(end - size)
+            scalar_tokens.append(token)
+        return byte_order + ''.join(scalar_tokens), offsets
+
+    def iter_unpack(self, buffer):
+        """
+        Streams decoded objects out of a buffer holding a whole number of consecutive objects.
+        An empty layout yields nothing, its objects take no room in the buffer.
+
+        """
+        if not self.size:
+            return iter(())
+        return map(self.decode, self.compiled.iter_unpack(buffer))
+
+    def __repr__(self):
+        return 'RuntimeMonitorCodec(' + self.type_def + ', ' + str(self.size) + ' bytes)'
@@ -9,14 +9,36 @@ or other languages.
 """
 import re
 import struct
-from collections import namedtuple
+
+from Lego.Datatypes.RuntimeMonitorCodec import ArrayFieldCodec, RuntimeMonitorCodec
+from Lego.Datatypes.RuntimeMonitorCodec import StructFieldCodec
+from Lego.Datatypes.RuntimeMonitorBatch import RuntimeMonitorBatch
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def _align(offset, alignment):
+    return -(-offset // alignment) * alignment
 
 class RuntimeMonitorParams:
     """
     Class defines compatible type to share data with external application via shared memory or
     mmap pages.
 
+    With the native byte order fields are aligned like the members of a C struct, padding and
+    align_to reproduce explicit padding and aligned attributes, and align_to with no argument at
+    the end reproduces the trailing padding counted by sizeof. Packed C structs of fixed width
+    types match the LITTLE-ENDIAN and BIG-ENDIAN byte orders, which never insert padding.
+
     """
+    PY_STRUCT_TO_NUMPY_KIND = {
+        's': 'S',
+        'b': 'i', 'h': 'i', 'i': 'i', 'l': 'i', 'q': 'i',
+        'B': 'u', 'H': 'u', 'I': 'u', 'L': 'u', 'Q': 'u', 'P': 'u',
+        'f': 'f', 'd': 'f',
+    }
     C_TYPE_TO_PY_STRUCT = {
         'char':                 's',
         'signed char':          'b',
@@ -55,113 +77,319 @@ class RuntimeMonitorParams:
         self.type_def = defs[byte_order]
         self.var_names = []
         self.string_positions = []
+        self.field_formats = []
         self.counter = 0
-        self.deserializer = None
+        self.codec = None
+        self.numpy_dtype = None
+        self.field_offsets = []
+        self.field_codecs = {}
+        self.layout_ops = []
+        self.end_of_fields = 0
+        self.alignment = 1
 
-    def add_unsigned_integer_field(self, name):
+    @classmethod
+    def from_layout(cls, layout):
         """
-        Adds an unsigned integer field
+        Rebuilds a layout from the dict returned by get_layout, for instance one stored in a
+        capture file by another process.
+
+        """
+        monitor = cls()
+        monitor.type_def = layout['type_def'][0]
+        if 'ops' in layout:
+            for op in layout['ops']:
+                monitor._replay(op)
+            return monitor
+        field_formats = re.findall(r'\d*[a-zA-Z?]', layout['type_def'][1:])
+        if len(field_formats) != len(layout['var_names']):
+            raise ValueError('Layout ' + layout['type_def'] + ' does not match its ' +
+                             str(len(layout['var_names'])) + ' field names')
+        for name, field_format in zip(layout['var_names'], field_formats):
+            if field_format.endswith('s'):
+                monitor.string_positions.append(monitor.counter)
+            monitor._add_field(name, field_format)
+        return monitor
+
+    def get_layout(self):
+        """
+        Returns the layout as a dict of plain values that can be stored as JSON.
+
+        """
+        return {'type_def': self.type_def, 'var_names': list(self.var_names),
+                'ops': [list(op) for op in self.layout_ops]}
+
+    def _replay(self, op):
+        kind, args = op[0], op[1:]
+        if kind == 'field' and args[1].endswith('s'):
+            self.add_string_field(args[0], int(args[1][:-1]))
+        elif kind == 'field':
+            self._add_field(*args)
+        elif kind == 'array':
+            self.add_array_field(*args)
+        elif kind == 'struct':
+            self.add_struct_field(args[0], RuntimeMonitorParams.from_layout(args[1]))
+        elif kind == 'padding':
+            self.add_padding(*args)
+        elif kind == 'align':
+            self.align_to(*args)
+        else:
+            raise ValueError('Unknown layout operation ' + str(kind))
+
+    def get_field_alignment(self, code):
+        """
+        Returns the alignment of a field of struct format code, 1 unless the byte order is
+        native.
+
+        """
+        if self.type_def[0] != '@':
+            return 1
+        return struct.calcsize('@c' + code) - struct.calcsize('@' + code)
+
+    def _reset_derived(self):
+        self.codec = None
+        self.numpy_dtype = None
+
+    def _add_field(self, name, field_format, alignment=None, op=None):
+        """
+        Appends a field to the layout and drops everything derived from the previous layout.
+
+        Padding the struct module would not insert by itself is written out in the type
+        definition, which stays a valid struct format.
 
         """
-        self.type_def += 'I'
+        alignment = alignment or self.get_field_alignment(field_format[-1])
+        offset = _align(self.end_of_fields, alignment)
+        natural = _align(self.end_of_fields, self.get_field_alignment(field_format[-1]))
+        if offset > natural:
+            self.type_def += str(offset - self.end_of_fields) + 'x'
+        self.type_def += field_format
         self.var_names.append(name)
+        self.field_formats.append(field_format)
+        self.field_offsets.append(offset)
+        self.layout_ops.append(op or ('field', name, field_format))
+        self.end_of_fields = offset + struct.calcsize(self.type_def[0] + field_format)
+        self.alignment = max(self.alignment, alignment)
         self.counter += 1
+        self._reset_derived()
+
+    def add_padding(self, size):
+        """
+        Adds size bytes of padding after the last field.
+
+        """
+        self.type_def += str(size) + 'x'
+        self.end_of_fields += size
+        self.layout_ops.append(('padding', size))
+        self._reset_derived()
+
+    def align_to(self, alignment=None):
+        """
+        Pads the layout to a multiple of alignment bytes, by default the largest alignment of
+        its fields like the trailing padding of a C struct. The next field and the whole record
+        are aligned accordingly.
+
+        """
+        alignment = alignment or self.alignment
+        padding = _align(self.end_of_fields, alignment) - self.end_of_fields
+        if padding:
+            self.type_def += str(padding) + 'x'
+            self.end_of_fields += padding
+        self.alignment = max(self.alignment, alignment)
+        self.layout_ops.append(('align', alignment))
+        self._reset_derived()
+
+    def add_array_field(self, name, c_type, length):
+        """
+        Adds a fixed size array of length elements of a C type, float samples[256] is added as
+        add_array_field('samples', 'float', 256). Arrays decode to memoryviews.
+
+        """
+        code = self.C_TYPE_TO_PY_STRUCT.get(c_type, c_type)
+        if code not in self.PY_STRUCT_TO_NUMPY_KIND or code == 's':
+            raise ValueError('Unsupported array element type ' + str(c_type) +
+                             ', char arrays are string fields')
+        field_codec = ArrayFieldCodec(self.type_def[0], code, length)
+        self.field_codecs[self.counter] = field_codec
+        self._add_field(name, str(field_codec.nbytes) + 's', self.get_field_alignment(code),
+                        ('array', name, code, length))
+
+    def add_struct_field(self, name, monitor):
+        """
+        Adds a nested struct of the layout of another RuntimeMonitorParams with the same byte
+        order, which must be complete. Nested structs decode to their own records.
+
+        """
+        if monitor.type_def[0] != self.type_def[0]:
+            raise ValueError('Nested struct byte order ' + monitor.type_def[0] +
+                             ' does not match ' + self.type_def[0])
+        nbytes = _align(monitor.get_size(), monitor.alignment)
+        self.field_codecs[self.counter] = StructFieldCodec(monitor, nbytes)
+        self._add_field(name, str(nbytes) + 's', monitor.alignment,
+                        ('struct', name, monitor.get_layout()))
+
+    def add_unsigned_integer_field(self, name):
+        """
+        Adds an unsigned integer field
+
+        """
+        self._add_field(name, 'I')
 
     def add_signed_integer_field(self, name):
         """
         Adds a signed integer field
 
         """
-        self.type_def += 'i'
-        self.var_names.append(name)
-        self.counter += 1
+        self._add_field(name, 'i')
 
     def add_signed_short_field(self, name):
         """
         Adds a signed short field
 
         """
-        self.type_def += 'h'
-        self.var_names.append(name)
-        self.counter += 1
+        self._add_field(name, 'h')
 
     def add_unsigned_short_field(self, name):
         """
         Adds an unsigned short field
 
         """
-        self.type_def += 'H'
-        self.var_names.append(name)
-        self.counter += 1
+        self._add_field(name, 'H')
 
     def add_signed_long_field(self, name):
         """
         Adds a signed long field
 
         """
-        self.type_def += 'l'
-        self.var_names.append(name)
-        self.counter += 1
+        self._add_field(name, 'l')
 
     def add_unsigned_long_field(self, name):
         """
         Adds an unsigned long field
 
         """
-        self.type_def += 'L'
-        self.var_names.append(name)
-        self.counter += 1
+        self._add_field(name, 'L')
 
     def add_float_field(self, name):
         """
         Adds an float field
 
         """
-        self.type_def += 'f'
-        self.var_names.append(name)
-        self.counter += 1
+        self._add_field(name, 'f')
 
     def add_double_field(self, name):
         """
         Adds an double field
 
         """
-        self.type_def += 'd'
-        self.var_names.append(name)
-        self.counter += 1
+        self._add_field(name, 'd')
 
     def add_string_field(self, name, max_size):
         """
         Adds an C style string field
 
         """
-        self.type_def += str(max_size) + 's'
-        self. var_names.append(name)
         self.string_positions.append(self.counter)
-        self.counter += 1
+        self._add_field(name, str(max_size) + 's')
+
+    def compile(self):
+        """
+        Freezes the layout defined so far into a codec, adding a field afterwards compiles a new
+        one on next use.
+
+        """
+        if self.codec is None:
+            self.codec = RuntimeMonitorCodec(self.type_def, self.var_names, self.string_positions,
+                                             self.field_codecs)
+        return self.codec
 
     def serialize(self, obj):
         """
         Flatten the object to be saved into shared memory.
 
         """
-        obj_as_list = list(obj)
-        for spos in self.string_positions:
-            obj_as_list[spos] = obj_as_list[spos].encode()
-        return struct.pack(self.type_def, *obj_as_list)
+        return self.compile().pack(obj)
 
-    def deserialize(self, obj):
+    def serialize_into(self, buffer, offset, obj):
         """
-        Create a python object out of memory bytes.
+        Flatten the object straight into a writable buffer at offset.
 
         """
-        if self.deserializer is None:
-            self.deserializer = namedtuple('RuntimeMonitorParamsDeserialized',
-                                           field_names=self.var_names)
+        self.compile().pack_into(buffer, offset, obj)
 
-        obj = self.deserializer._make(struct.unpack(self.type_def, obj))
-        obj_as_dict = obj._asdict()
-        for spos in self.string_positions:
-            string_value = getattr(obj, self.var_names[spos]).decode('utf-8')
-            obj_as_dict[self.var_names[spos]] = string_value
-        return self.deserializer(*obj_as_dict.values())
+    def get_size(self):
+        """
+        Returns the size in bytes of one serialized object.
+
+        """
+        return self.compile().size
+
+    def deserialize(self, obj, offset=0):
+        """
+        Create a python object out of memory bytes. Accepts any buffer, including memoryview
+        slices of shared memory, the object is unpacked in place starting at offset. C strings
+        are cut at their NUL padding.
+
+        """
+        return self.compile().unpack_from(obj, offset)
+
+    def iter_deserialize(self, obj):
+        """
+        Streams python objects out of a buffer of consecutive objects.
+
+        """
+        return self.compile().iter_unpack(obj)
+
+    def deserialize_batch(self, obj, count=-1, offset=0):
+        """
+        Create a columnar RuntimeMonitorBatch out of consecutive objects in memory bytes or a
+        Shmem record sequence, without building a Python object per record.
+
+        """
+        return RuntimeMonitorBatch(self).extend(obj, count, offset)
+
+    def get_numpy_dtype(self):
+        """
+        Returns a NumPy structured dtype with the same field offsets and record size as the
+        struct layout.
+
+        """
+        if numpy is None:
+            raise ImportError('numpy is required for bulk deserialization, pip install numpy')
+        if self.numpy_dtype is None:
+            byte_order = self.type_def[0]
+            numpy_order = '=' if byte_order == '@' else byte_order
+            formats = []
+            for position, field_format in enumerate(self.field_formats):
+                field_codec = self.field_codecs.get(position)
+                if isinstance(field_codec, ArrayFieldCodec):
+                    formats.append((numpy_order +
+                                    self.PY_STRUCT_TO_NUMPY_KIND[field_codec.code] +
+                                    str(field_codec.itemsize), (field_codec.length,)))
+                elif isinstance(field_codec, StructFieldCodec):
+                    formats.append(field_codec.monitor.get_numpy_dtype())
+                else:
+                    formats.append(numpy_order + self.PY_STRUCT_TO_NUMPY_KIND[field_format[-1]] +
+                                   str(struct.calcsize(byte_order + field_format)))
+            self.numpy_dtype = numpy.dtype({'names': list(self.var_names), 'formats': formats,
+                                            'offsets': self.field_offsets,
+                                            'itemsize': self.get_size()})
+        return self.numpy_dtype
+
+    def deserialize_many(self, obj, count=-1, offset=0):
+        """
+        Create a NumPy structured array out of consecutive objects in memory bytes. NumPy is an
+        optional dependency, this raises ImportError without it.
+
+        Plain buffers are decoded in place with a single numpy.frombuffer call, so slices of
+        shared memory are not copied. Shmem record sequences are viewed run by run, strided
+        over their frames, and only copied when they consist of more than one run.
+
+        """
+        dtype = self.get_numpy_dtype()
+        if hasattr(obj, 'get_chunks'):
+            arrays = [numpy.ndarray((chunk_count,), dtype, buffer, chunk_offset, (stride,))
+                      for buffer, chunk_offset, chunk_count, stride in obj.get_chunks()]
+            if len(arrays) == 1:
+                return arrays[0]
+            return numpy.concatenate(arrays) if arrays else numpy.empty(0, dtype)
+        return numpy.frombuffer(obj, dtype, count, offset)
@@ -4,3 +4,5 @@ Exports from datatypes.
 """
 from Lego.Datatypes.InputParams import InputParams
 from Lego.Datatypes.RuntimeMonitorParams import RuntimeMonitorParams
+from Lego.Datatypes.RuntimeMonitorCodec import RuntimeMonitorCodec
+from Lego.Datatypes.RuntimeMonitorBatch import FieldColumn, RuntimeMonitorBatch, StringColumn
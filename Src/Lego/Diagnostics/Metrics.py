@@ -0,0 +1,244 @@
+"""
+Runtime metrics of plugin calls: latency histograms, throughput, in flight and failure counts.
+
+"""
+import bisect
+import threading
+import time
+
+class Histogram:
+    """
+    Histogram with exponential buckets from one microsecond to about a hundred seconds,
+    percentiles are reported as the upper bound of their bucket.
+
+    """
+    BOUNDS = [1e-6 * 2 ** exponent for exponent in range(28)]
+
+    def __init__(self):
+        """
+        Builds an empty histogram.
+
+        """
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        """
+        Adds a value in seconds.
+
+        """
+        self.buckets[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, fraction):
+        """
+        Returns the value below which fraction of the observations fall, None if empty.
+
+        """
+        if self.count == 0:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for position, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank and bucket:
+                return self.BOUNDS[position] if position < len(self.BOUNDS) else float('inf')
+        return float('inf')
+
+    def mean(self):
+        """
+        Returns the mean of the observations, None if empty.
+
+        """
+        return self.total / self.count if self.count else None
+
+class Series:
+    """
+    Metrics of one operation of one plugin.
+
+    """
+    RATE_WINDOW = 1.0
+
+    def __init__(self, group, name, operation):
+        """
+        Builds an empty series.
+
+        """
+        self.group = group
+        self.name = name
+        self.operation = operation
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.latency = Histogram()
+        self.queue_wait = Histogram()
+        self.window_start = time.monotonic()
+        self.window_calls = 0
+        self.rate = 0.0
+
+    def submitted(self):
+        """
+        Counts a call as in flight, returns its submission time.
+
+        """
+        with self.lock:
+            self.in_flight += 1
+        return time.perf_counter()
+
+    def started(self, submitted):
+        """
+        Records how long a call waited in the queue.
+
+        """
+        with self.lock:
+            self.queue_wait.observe(time.perf_counter() - submitted)
+
+    def cancelled(self):
+        """
+        Removes a call that was cancelled before it started from the calls in flight.
+
+        """
+        with self.lock:
+            self.in_flight -= 1
+
+    def finished(self, started, failed, in_flight=True):
+        """
+        Records a finished call that started at started.
+
+        """
+        now = time.monotonic()
+        latency = time.perf_counter() - started
+        with self.lock:
+            if in_flight:
+                self.in_flight -= 1
+            self.calls += 1
+            if failed:
+                self.failures += 1
+            self.latency.observe(latency)
+            self.window_calls += 1
+            elapsed = now - self.window_start
+            if elapsed >= self.RATE_WINDOW:
+                self.rate = self.window_calls / elapsed
+                self.window_start = now
+                self.window_calls = 0
+
+    def get_rate(self):
+        """
+        Returns calls per second over the last complete window.
+
+        """
+        with self.lock:
+            elapsed = time.monotonic() - self.window_start
+            if elapsed >= 2 * self.RATE_WINDOW or (self.rate == 0.0 and elapsed > 0):
+                # No complete window yet, or no call finished for a whole window.
+                return self.window_calls / elapsed
+            return self.rate
+
+    def snapshot(self):
+        """
+        Returns the current values as a dict.
+
+        """
+        rate = self.get_rate()
+        with self.lock:
+            return {
+                'group': self.group,
+                'plugin': self.name,
+                'operation': self.operation,
+                'calls': self.calls,
+                'failures': self.failures,
+                'in_flight': self.in_flight,
+                'calls_per_second': rate,
+                'latency_p50': self.latency.percentile(0.5),
+                'latency_p99': self.latency.percentile(0.99),
+                'latency_mean': self.latency.mean(),
+                'queue_wait_p50': self.queue_wait.percentile(0.5),
+                'queue_wait_p99': self.queue_wait.percentile(0.99),
+            }
+
+class Metrics:
+    """
+    Registry of the series of every plugin operation, disabled by default.
+
+    """
+    enabled = False
+    series = {}
+    lock = threading.Lock()
+
+    @classmethod
+    def enable(cls):
+        """
+        Starts collecting metrics.
+
+        """
+        cls.enabled = True
+
+    @classmethod
+    def disable(cls):
+        """
+        Stops collecting metrics, collected series are kept until reset.
+
+        """
+        cls.enabled = False
+
+    @classmethod
+    def get_series(cls, group, name, operation):
+        """
+        Returns the series of an operation of a plugin, creating it on first use.
+
+        """
+        key = (group, name, operation)
+        series = cls.series.get(key)
+        if series is None:
+            with cls.lock:
+                series = cls.series.setdefault(key, Series(group, name, operation))
+        return series
+
+    @classmethod
+    def snapshot(cls):
+        """
+        Returns the values of every series.
+
+        """
+        return [series.snapshot() for series in list(cls.series.values())]
+
+    @classmethod
+    def get_failures_by_group(cls):
+        """
+        Returns the number of failed calls by group.
+
+        """
+        failures = {}
+        for series in list(cls.series.values()):
+            failures[series.group] = failures.get(series.group, 0) + series.failures
+        return failures
+
+    @classmethod
+    def export_text(cls):
+        """
+        Returns a text snapshot, one line per value, slowest runs first.
+
+        """
+        lines = []
+        snapshots = sorted(cls.snapshot(), key=lambda values: -(values['latency_p99'] or 0))
+        for values in snapshots:
+            labels = ('{group="' + str(values['group']) + '",plugin="' + str(values['plugin']) +
+                      '",operation="' + values['operation'] + '"}')
+            for key, value in values.items():
+                if key not in ('group', 'plugin', 'operation') and value is not None:
+                    lines.append('plugin_' + key + labels + ' ' + repr(value))
+        for group, failures in sorted(cls.get_failures_by_group().items(), key=str):
+            lines.append('group_failures{group="' + str(group) + '"} ' + str(failures))
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def reset(cls):
+        """
+        Drops every series.
+
+        """
+        with cls.lock:
+            cls.series = {}
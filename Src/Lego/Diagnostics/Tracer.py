@@ -0,0 +1,65 @@
+"""
+Low overhead tracing of plugin and IPC calls into an in-memory buffer.
+
+"""
+import threading
+import time
+from collections import deque
+
+class Tracer:
+    """
+    Records span events while enabled, disabled by default.
+
+    Events are appended to a bounded deque, appends are atomic so writers never take a lock and
+    the oldest events are dropped once it is full. Call sites check Tracer.enabled before
+    recording, which is all tracing costs while it is off.
+
+    """
+    enabled = False
+    events = deque(maxlen=65536)
+
+    @classmethod
+    def enable(cls, capacity=None):
+        """
+        Starts recording, optionally resizing the buffer to capacity events.
+
+        """
+        if capacity is not None and capacity != cls.events.maxlen:
+            cls.events = deque(cls.events, maxlen=capacity)
+        cls.enabled = True
+
+    @classmethod
+    def disable(cls):
+        """
+        Stops recording, recorded events are kept until exported.
+
+        """
+        cls.enabled = False
+
+    @classmethod
+    def record(cls, kind, name, target=None, detail=None):
+        """
+        Records an event of a kind ('enter', 'exit', 'exception', ...) for the span name.
+
+        """
+        cls.events.append((time.perf_counter_ns(), threading.get_ident(), kind, name, target,
+                           detail))
+
+    @classmethod
+    def export(cls, clear=True):
+        """
+        Returns the recorded events as dicts, oldest first.
+
+        """
+        if clear:
+            # Pop one by one, events recorded meanwhile are neither lost nor exported twice.
+            events = []
+            while True:
+                try:
+                    events.append(cls.events.popleft())
+                except IndexError:
+                    break
+        else:
+            events = cls.events.copy()
+        return [{'time_ns': event[0], 'thread': event[1], 'kind': event[2], 'name': event[3],
+                 'target': event[4], 'detail': event[5]} for event in events]
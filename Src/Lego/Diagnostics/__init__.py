@@ -0,0 +1,6 @@
+"""
+Exports from diagnostics.
+
+"""
+from Lego.Diagnostics.Tracer import Tracer
+from Lego.Diagnostics.Metrics import Metrics
@@ -4,133 +4,811 @@ Facilitates data exchange between different processes using mmap shared memory.
 """
 import os
 import mmap
+import errno
+import select
+import asyncio
+import contextlib
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from Lego.Diagnostics import Tracer
 
 import struct
+from collections.abc import Sequence
+
+FRAME_FORMAT = '@II'
+FRAME_SIZE = struct.calcsize(FRAME_FORMAT)
+FRAME_TAG_OFFSET = struct.calcsize('@I')
+FRAME_ALIGNMENT = 8
+# Tag bit of frames reserved by one of several writers whose payload is not written yet.
+PENDING_TAG = 1 << 31
+
+def _align(offset):
+    return (offset + FRAME_ALIGNMENT - 1) & ~(FRAME_ALIGNMENT - 1)
 
 class _ShmemMeta:
     """
     Implements index for mmap space.
 
+    Objects are framed by their size and a type tag so objects of different layouts can share a
+    segment. The header is followed by an optional table holding the offset of the first
+    size_of_index frames. The size of the segment is kept in the header so readers notice when
+    the writer grows it, the flags hold the writer mode, zero until a writer set up the segment.
+    Frames reserved by one of several writers only count as committed objects once written.
+
+    The header starts with a generation counter that is odd while a writer rewrites it, readers
+    retry until they read the same even generation before and after the header. It is followed
+    by the number of readers waiting on the notification pipe, writers never rewrite it.
+
     """
-    def __init__(self):
+    FORMAT = '@QQQQQQQ'
+    HEADER_SIZE = struct.calcsize(FORMAT)
+    READERS_OFFSET = HEADER_SIZE
+    SHARED_WRITERS = 1
+    SINGLE_WRITER = 2
+
+    def __init__(self, size_of_index=0, size_of_segment=0, flags=0):
         """
         Initializes index.
 
         """
-        self.size_of_objects = 0
+        self.generation = 0
         self.number_of_objects = 0
-        self.size_of = 0
-        self.size_of = len(self.get_bytes())
+        self.end_of_objects = 0
+        self.size_of_index = size_of_index
+        self.size_of_segment = size_of_segment
+        self.flags = flags
+        self.committed_objects = 0
+        self.end_of_objects = self.start_of_objects()
 
-    def set_size(self, size):
+    def added_object(self, size):
         """
-        Sets size of objects, common for all objects.
+        Increments after each object is added.
 
         """
-        self.size_of_objects = size
+        self.number_of_objects += 1
+        self.end_of_objects = _align(self.end_of_objects + FRAME_SIZE + size)
+        if not self.flags & self.SHARED_WRITERS:
+            self.committed_objects = self.number_of_objects
 
-    def added_object(self):
+    def get_number_of_objects(self):
         """
-        Increments after each object is added.
+        Returns number of objects.
 
         """
-        self.number_of_objects += 1
+        return self.number_of_objects
 
-    def get_size_of_object(self):
+    def get_end_of_objects(self):
         """
-        Returns size of individual object.
+        Returns offset where the next object frame starts.
 
         """
-        return self.size_of_objects
+        return self.end_of_objects
 
-    def get_number_of_objects(self):
+    def get_index_offset(self, position):
         """
-        Returns number of objects.
+        Returns offset of the index entry holding the frame offset of object at position.
 
         """
-        return self.number_of_objects
+        return self.size_of_meta() + position * struct.calcsize('@Q')
+
+    def start_of_objects(self):
+        """
+        Returns offset of the first object frame.
+
+        """
+        return _align(self.get_index_offset(self.size_of_index))
 
     def get_bytes(self):
         """
         Converts this class into byte representation.
 
         """
-        return struct.pack('@ii', self.size_of_objects, self.number_of_objects)
+        return struct.pack(self.FORMAT, self.generation, self.number_of_objects,
+                           self.end_of_objects, self.size_of_index, self.size_of_segment,
+                           self.flags, self.committed_objects)
 
     def from_bytes(self, sbyte):
         """
         Loads this object from byte representation.
 
         """
-        self.size_of_objects, self.number_of_objects = struct.unpack('@ii', sbyte)
+        (self.generation, self.number_of_objects, self.end_of_objects, self.size_of_index,
+         self.size_of_segment, self.flags, self.committed_objects) = struct.unpack(self.FORMAT,
+                                                                                   sbyte)
 
     def size_of_meta(self):
         """
-        Returns size of meta table.
+        Returns size of meta table, the header and the number of waiting readers.
+
+        """
+        return self.READERS_OFFSET + struct.calcsize('@Q')
+
+    def __repr__(self):
+        return (str(self.number_of_objects) + ' objects in ' + str(self.end_of_objects) +
+                ' of ' + str(self.size_of_segment) + ' bytes, ' + str(self.size_of_index) +
+                ' indexed')
+
+class ShmemRecords(Sequence):
+    """
+    Lazy sequence of records backed by memoryview slices of the shared memory, no record is
+    copied out of the mapping.
+
+    The views stay valid only while the writer does not overwrite the records and the mapping is
+    not closed, decode them before handing the memory back.
+
+    """
+    def __init__(self, buffer, base_offset, size_of_objects, start, count, capacity=None):
+        """
+        Describes count records of size_of_objects starting at record start after base_offset.
+        When capacity is given records wrap around after capacity slots.
+
+        """
+        self.buffer = buffer
+        self.base_offset = base_offset
+        self.size_of_objects = size_of_objects
+        self.start = start
+        self.count = count
+        self.capacity = capacity
+
+    def get_offset(self, index):
+        """
+        Returns the offset of record at index within the buffer.
+
+        """
+        slot = self.start + index
+        if self.capacity is not None:
+            slot %= self.capacity
+        return self.base_offset + slot * self.size_of_objects
+
+    def get_chunks(self):
+        """
+        Returns (buffer, offset, count, stride) for each contiguous run of records, a ring that
+        wraps around yields two runs.
+
+        """
+        if self.count == 0:
+            return []
+        stride = self.size_of_objects
+        first = self.get_offset(0)
+        if self.capacity is None:
+            return [(self.buffer, first, self.count, stride)]
+        leading = min(self.count, self.capacity - (self.start % self.capacity))
+        chunks = [(self.buffer, first, leading, stride)]
+        if leading < self.count:
+            chunks.append((self.buffer, self.get_offset(leading), self.count - leading, stride))
+        return chunks
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return ShmemRecords(self.buffer, self.base_offset, self.size_of_objects,
+                                self.start + start, max(stop - start, 0), self.capacity)
+        if index < 0:
+            index += self.count
+        if index < 0 or index >= self.count:
+            raise IndexError('Shmem record index out of range')
+        offset = self.get_offset(index)
+        return self.buffer[offset:offset + self.size_of_objects]
+
+    def __repr__(self):
+        return str(self.count) + ' records each of size ' + str(self.size_of_objects)
+
+class ShmemFrames(Sequence):
+    """
+    Lazy sequence of framed objects backed by memoryview slices of the shared memory.
+
+    Frame offsets come from the index of the segment, frames past the index are located by
+    walking their size prefixes, payloads are never copied.
+
+    """
+    def __init__(self, buffer, offsets):
+        """
+        Describes the frames starting at offsets within the buffer.
+
+        """
+        self.buffer = buffer
+        self.offsets = offsets
+
+    def get_tag(self, index):
+        """
+        Returns the type tag of object at index.
+
+        """
+        return struct.unpack_from(FRAME_FORMAT, self.buffer, self.offsets[index])[1]
+
+    def get_size(self, index):
+        """
+        Returns the size of object at index.
+
+        """
+        return struct.unpack_from(FRAME_FORMAT, self.buffer, self.offsets[index])[0]
+
+    def with_tag(self, tag):
+        """
+        Returns the objects written with the type tag.
+
+        """
+        return ShmemFrames(self.buffer, [offset for offset in self.offsets
+                                         if struct.unpack_from(FRAME_FORMAT, self.buffer,
+                                                               offset)[1] == tag])
+
+    def get_chunks(self):
+        """
+        Returns (buffer, offset, count, stride) for each run of equally sized objects laid out
+        at a constant stride.
+
         """
-        return len(self.get_bytes())
+        chunks = []
+        first = 0
+        while first < len(self.offsets):
+            size = self.get_size(first)
+            last = first + 1
+            stride = _align(FRAME_SIZE + size)
+            while (last < len(self.offsets) and self.get_size(last) == size and
+                   self.offsets[last] - self.offsets[last - 1] == stride):
+                last += 1
+            chunks.append((self.buffer, self.offsets[first] + FRAME_SIZE, last - first, stride))
+            first = last
+        return chunks
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ShmemFrames(self.buffer, self.offsets[index])
+        offset = self.offsets[index]
+        size = struct.unpack_from(FRAME_FORMAT, self.buffer, offset)[0]
+        return self.buffer[offset + FRAME_SIZE:offset + FRAME_SIZE + size]
 
     def __repr__(self):
-        return str(self.number_of_objects) + ' each of size ' + str(self.size_of_objects)
+        return str(len(self.offsets)) + ' framed records'
 
 class Shmem():
     """
     Inter process communication mechanism.
 
+    Segments are backed by files in the first of SHMEM_DIRECTORIES that exists, on Linux that is
+    the tmpfs mounted on /dev/shm so pages are never written back to disk.
+
+    Several processes may append to one segment when all of them are created with shared_writers
+    set. They reserve frames under an flock lock on the file, write their payloads without
+    holding it and then commit each frame, readers skip frames that are not committed.
+
     """
-    def __init__(self, taskid, child=True):
+    SHMEM_DIRECTORIES = ('/dev/shm', tempfile.gettempdir())
+    DEFAULT_SIZE = 16384
+    # Seconds a reader waits for a header being rewritten before giving up on its writer.
+    HEADER_TIMEOUT = 1.0
+
+    def __init__(self, taskid, child=True, size_of_index=0, size=DEFAULT_SIZE, growable=False,
+                 shared_writers=False, reset=False):
         """
         Initialize a shared memory block to share data between processes.
 
+        The writer reserves an index for the first size_of_index objects so readers can seek to
+        any of them in constant time. A growable writer remaps a larger segment instead of
+        failing when it runs out of room, readers follow it on their next read. Readers open the
+        segment of an existing writer and map it at the size the writer gave it, size only
+        applies to writers.
+
+        A single writer always starts the segment over. Shared writers join the segment the
+        first of them set up, a writer with reset set starts it over instead, for instance when
+        a previous run left a segment behind, see unlink as well.
+
         """
         self.meta = None
         self.sharedmem = None
-        self.size = 16384
+        self.taskid = taskid
+        self.path = None
+        self.size = size
+        self.size_of_index = size_of_index
+        self.growable = growable
+        self.shared_writers = shared_writers and child is True
+        self.reset = reset
+        self.seen_objects = 0
+        self.notify_fd = None
+        self.wakeup_fds = None
+        self.lock_fd = None
+        self.lock_pid = None
+        # flock locks exclude other open files only, threads sharing this one take this first.
+        self.segment_lock = threading.Lock()
+        self.fd = None
         self._create_shmem(taskid, child)
 
+    @staticmethod
+    def size_for(size_of_object, number_of_objects, size_of_index=0):
+        """
+        Returns the segment size needed for number_of_objects objects of size_of_object bytes,
+        for instance the size of a RuntimeMonitorParams layout.
 
-    def _create_shmem(self, taskid, child):
-        self.meta = _ShmemMeta()
-        if child is False:
-            if os.name == 'nt':
-                self.sharedmem = mmap.mmap(-1, self.size, tagname='/tmp/fullsight.' + str(taskid))
-            else:
-                self.sharedmem = mmap.mmap(os.open('/tmp/fullsight.' + str(taskid)).fileno(),
-                                           self.size, access=mmap.ACCESS_READ)
+        """
+        meta = _ShmemMeta(size_of_index)
+        return meta.start_of_objects() + number_of_objects * _align(FRAME_SIZE + size_of_object)
+
+    @classmethod
+    def get_path(cls, taskid):
+        """
+        Returns the path of the file backing the segment of the task.
+
+        """
+        for directory in cls.SHMEM_DIRECTORIES:
+            if os.path.isdir(directory):
+                return os.path.join(directory, 'fullsight.' + str(taskid))
+        return 'fullsight.' + str(taskid)
+
+    @classmethod
+    def unlink(cls, taskid):
+        """
+        Removes the file backing the segment of the task and its notification pipe, so the
+        next writer starts from an empty segment. Processes that mapped it keep their mapping
+        until they close it.
+
+        """
+        path = cls.get_path(taskid)
+        for name in (path, path + '.notify'):
+            try:
+                os.unlink(name)
+            except FileNotFoundError:
+                pass
+
+    def _map_shmem(self, taskid, child, writable):
+        """
+        Maps the shared memory block for the task. Writers create the backing file or extend
+        it to their size, readers open the file of the writer and map it as large as it is.
+
+        The file stays open until close, the segment is remapped from it when it grows.
+
+        """
+        if os.name == 'nt':
+            self.path = '/tmp/fullsight.' + str(taskid)
+            return mmap.mmap(-1, self.size, tagname=self.path)
+        self.path = self.get_path(taskid)
+        if child is True:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        else:
+            # Readers write the number of waiting readers through the file.
+            self.fd = os.open(self.path, os.O_RDWR)
+            self.size = 0
+        return self._remap(writable)
+
+    def _remap(self, writable):
+        """
+        Maps the segment from the open backing file, extending the file to self.size first if
+        it is smaller, readers set self.size no larger than the file. Returns the new mapping.
+
+        """
+        current_size = os.fstat(self.fd).st_size
+        if current_size < self.size:
+            os.ftruncate(self.fd, self.size)
         else:
-            if os.name == 'nt':
-                self.sharedmem = mmap.mmap(-1, self.size, tagname='/tmp/fullsight.' + str(taskid))
-            else:
-                self.sharedmem = mmap.mmap(os.open('/tmp/fullsight.' + str(taskid)).fileno(),
-                                           self.size, access=mmap.ACCESS_WRITE)
-            self.sharedmem.write(self.meta.get_bytes())
-        self.sharedmem.seek(0)
-        self.meta.from_bytes(self.sharedmem.read(self.meta.size_of_meta()))
+            self.size = current_size
+        access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        return mmap.mmap(self.fd, self.size, access=access)
+
+    def _create_shmem(self, taskid, child):
+        self.meta = _ShmemMeta(self.size_of_index)
+        self.sharedmem = self._map_shmem(taskid, child, writable=child)
+        self.meta.size_of_segment = self.size
+        if self.shared_writers:
+            if fcntl is None:
+                raise ValueError('Shared writers need fcntl file locks')
+            self.meta.flags = _ShmemMeta.SHARED_WRITERS
+            with self._lock_segment():
+                # The first writer sets up the segment, the others join it.
+                current = _ShmemMeta()
+                current.from_bytes(self.sharedmem[0:_ShmemMeta.HEADER_SIZE])
+                if self.reset or not current.flags:
+                    self.meta.generation = current.generation
+                    self._write_meta()
+                elif not current.flags & _ShmemMeta.SHARED_WRITERS:
+                    raise ValueError('Shared memory of task ' + str(taskid) +
+                                     ' has a single writer, unlink it or reset it')
+        elif child is True:
+            self.meta.flags = _ShmemMeta.SINGLE_WRITER
+            # Readers of a previous writer must still see the generation move on.
+            self.meta.generation = struct.unpack_from('@Q', self.sharedmem, 0)[0]
+            self._write_meta()
+        self._load_meta()
+
+    @contextlib.contextmanager
+    def _lock_segment(self):
+        """
+        Holds the lock writers take to reserve frames and readers take to count themselves.
+
+        The lock is taken with flock on a file opened by this process only, flock locks belong
+        to the open file so a forked child opens its own and closing other descriptors of the
+        segment never drops the lock.
+
+        """
+        with self.segment_lock:
+            if self.lock_pid != os.getpid():
+                self.lock_fd = os.open(self.path, os.O_RDONLY)
+                self.lock_pid = os.getpid()
+            fcntl.flock(self.lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+
+    def _grow(self, required):
+        """
+        Remaps the writer on a segment large enough for required bytes.
+
+        Views handed out earlier keep the previous mapping alive until they are released.
+
+        """
+        if not self.growable or os.name == 'nt':
+            raise ValueError('Shared memory of ' + str(self.size) + ' bytes is full')
+        size = self.size
+        while size < required:
+            size *= 2
+        self.size = size
+        self.sharedmem = self._remap(writable=True)
+        self.meta.size_of_segment = self.size
+
+    def _write_meta(self):
+        """
+        Publishes the local header, its generation is odd while the header is being written.
+
+        """
+        meta = self.meta
+        # A writer that died while writing the header left its generation odd.
+        meta.generation += (meta.generation & 1) + 1
+        # struct.pack_into clears the bytes before packing, readers could see a zero generation.
+        self.sharedmem[0:8] = struct.pack('@Q', meta.generation)
+        self.sharedmem[0:meta.HEADER_SIZE] = meta.get_bytes()
+        meta.generation += 1
+        self.sharedmem[0:8] = struct.pack('@Q', meta.generation)
+
+    def _load_meta(self):
+        # The writer may be rewriting the header, only trust a copy taken while the generation
+        # stayed the same and even.
+        sharedmem = self.sharedmem
+        deadline = None
+        while True:
+            generation = struct.unpack_from('@Q', sharedmem, 0)[0]
+            if not generation & 1:
+                header = sharedmem[0:_ShmemMeta.HEADER_SIZE]
+                if struct.unpack_from('@Q', sharedmem, 0)[0] == generation:
+                    break
+            # Let the writer finish, a generation that stays odd belongs to a writer that died.
+            if deadline is None:
+                deadline = time.monotonic() + self.HEADER_TIMEOUT
+            elif time.monotonic() > deadline:
+                raise TimeoutError('Header of shared memory of task ' + str(self.taskid) +
+                                   ' is still being written after ' + str(self.HEADER_TIMEOUT) +
+                                   ' seconds')
+            time.sleep(0)
+        self.meta.from_bytes(header)
+        if self.meta.size_of_segment > self.size:
+            self.size = self.meta.size_of_segment
+            self.sharedmem = self._remap(writable=self.shared_writers)
+
+    def _next_frame(self, offset):
+        return _align(offset + FRAME_SIZE +
+                      struct.unpack_from(FRAME_FORMAT, self.sharedmem, offset)[0])
+
+    def _frame_offsets(self):
+        """
+        Returns the frame offset of every object, from the index as far as it goes.
+
+        """
+        count = self.meta.get_number_of_objects()
+        indexed = min(count, self.meta.size_of_index)
+        offsets = []
+        if indexed:
+            start = self.meta.get_index_offset(0)
+            offsets = list(memoryview(self.sharedmem)[start:start + indexed * 8].cast('Q'))
+        offset = self.meta.start_of_objects()
+        if offsets:
+            offset = self._next_frame(offsets[-1])
+        while len(offsets) < count:
+            offsets.append(offset)
+            offset = self._next_frame(offset)
+        return offsets
 
     def read_shmem(self):
         """
         Reads shared memory.
 
         """
-        objs = []
-        self.sharedmem.seek(0)
-        self.meta.from_bytes(self.sharedmem.read(self.meta.size_of_meta()))
-        for _ in range(self.meta.get_number_of_objects()):
-            obj = self.sharedmem.read(self.meta.get_size_of_object())
-            objs.append(obj)
-        print(len(objs))
+        objs = [bytes(obj) for obj in self.read_views()]
+        if Tracer.enabled:
+            Tracer.record('read', 'shmem', self.taskid, len(objs))
         return objs
 
-    def append_shmem(self, obj):
+    def _committed_offsets(self):
+        """
+        Returns the frame offset of every committed object, skipping frames still pending.
+
+        """
+        offsets = self._frame_offsets()
+        if self.meta.flags & _ShmemMeta.SHARED_WRITERS:
+            offsets = [offset for offset in offsets
+                       if not struct.unpack_from(FRAME_FORMAT, self.sharedmem, offset)[1] &
+                       PENDING_TAG]
+        return offsets
+
+    def read_views(self):
+        """
+        Reads shared memory without copying, returns the objects as memoryview slices.
+
+        """
+        self._load_meta()
+        self.seen_objects = self.meta.committed_objects
+        return ShmemFrames(memoryview(self.sharedmem), self._committed_offsets())
+
+    def read_record(self, position):
+        """
+        Reads object at position among the ones read_views returns, without copying. Constant
+        time while it is indexed and no object is pending. Does not count as a read for
+        wait_for_data.
+
+        """
+        self._load_meta()
+        if position < 0 or position >= self.meta.committed_objects:
+            raise IndexError('Shmem record index out of range')
+        if (position < self.meta.size_of_index and
+                self.meta.committed_objects == self.meta.get_number_of_objects()):
+            offset = struct.unpack_from('@Q', self.sharedmem,
+                                        self.meta.get_index_offset(position))[0]
+        else:
+            offset = self._committed_offsets()[position]
+        return ShmemFrames(memoryview(self.sharedmem), [offset])[0]
+
+    def _reserve_frame(self, size, tag):
+        """
+        Writes the frame header of an object after the last one and accounts for it in the
+        local header, readers do not see it until the header is published. Returns its offset.
+
+        """
+        offset = self.meta.get_end_of_objects()
+        if _align(offset + FRAME_SIZE + size) > self.size:
+            self._grow(_align(offset + FRAME_SIZE + size))
+        struct.pack_into(FRAME_FORMAT, self.sharedmem, offset, size, tag)
+        position = self.meta.get_number_of_objects()
+        if position < self.meta.size_of_index:
+            struct.pack_into('@Q', self.sharedmem, self.meta.get_index_offset(position), offset)
+        self.meta.added_object(size)
+        return offset
+
+    def _write_frame(self, obj, tag):
         """
-        Appends to shared memory.
+        Writes the frame of an object after the last one, see _reserve_frame.
 
         """
-        current = self.sharedmem.tell()
-        self.sharedmem.seek(0)
-        self.meta.set_size(len(obj))
-        self.meta.added_object()
-        self.sharedmem.write(self.meta.get_bytes())
-        self.sharedmem.seek(current)
-        self.sharedmem.write(obj)
+        offset = self._reserve_frame(len(obj), tag)
+        self.sharedmem[offset + FRAME_SIZE:offset + FRAME_SIZE + len(obj)] = obj
 
+    def _append_shared(self, objs, tag):
+        """
+        Appends objects next to other writers. Frames are reserved and published as pending
+        under the writers lock, payloads are written and frames committed after releasing it.
+
+        """
+        if tag & PENDING_TAG:
+            raise ValueError('Type tag ' + str(tag) + ' is reserved')
+        objs = list(objs)
+        with self._lock_segment():
+            self.meta.from_bytes(self.sharedmem[0:_ShmemMeta.HEADER_SIZE])
+            if self.meta.size_of_segment > self.size:
+                self.size = self.meta.size_of_segment
+                self.sharedmem = self._remap(writable=True)
+            offsets = [self._reserve_frame(len(obj), tag | PENDING_TAG) for obj in objs]
+            if offsets:
+                self._write_meta()
+        sharedmem = self.sharedmem
+        for offset, obj in zip(offsets, objs):
+            sharedmem[offset + FRAME_SIZE:offset + FRAME_SIZE + len(obj)] = obj
+            # Commit the object only once its payload is in place. struct.pack_into would clear
+            # the tag first, readers could see the object committed with tag 0.
+            sharedmem[offset + FRAME_TAG_OFFSET:offset + FRAME_SIZE] = struct.pack('@I', tag)
+        if offsets:
+            # Count the commits after the tags, readers waiting for them wake up then.
+            with self._lock_segment():
+                self.meta.from_bytes(self.sharedmem[0:_ShmemMeta.HEADER_SIZE])
+                self.meta.committed_objects += len(offsets)
+                self._write_meta()
+            self._notify()
+        return len(offsets)
+
+    def _publish(self):
+        self._write_meta()
+        self._notify()
+
+    def append_shmem(self, obj, tag=0):
+        """
+        Appends to shared memory, the type tag tells readers which layout the object has.
+
+        """
+        if self.shared_writers:
+            self._append_shared((obj,), tag)
+            return
+        self._write_frame(obj, tag)
+        # Publish the object only once its frame is in place.
+        self._publish()
+
+    def append_many(self, objs, tag=0):
+        """
+        Appends a batch of objects of the same type tag and publishes them with a single header
+        update, readers see either none or all of them. Returns the number of objects appended.
+
+        A batch that raises, for instance because the segment is full, is not appended at all.
+        With shared writers the objects are reserved together but committed one by one.
+
+        """
+        if self.shared_writers:
+            return self._append_shared(objs, tag)
+        # A batch that fails half way is dropped, the next append must not publish it either.
+        saved = self.meta.get_bytes()
+        count = 0
+        try:
+            for obj in objs:
+                self._write_frame(obj, tag)
+                count += 1
+        except BaseException:
+            self.meta.from_bytes(saved)
+            # The segment may have grown meanwhile, readers must map all of it.
+            self.meta.size_of_segment = self.size
+            raise
+        if count:
+            self._publish()
+        return count
+
+    def _has_new_data(self):
+        """
+        Returns True if objects were committed since the previous read.
+
+        """
+        self._load_meta()
+        return self.meta.committed_objects > self.seen_objects
+
+    def _notify(self):
+        """
+        Wakes up a reader waiting on the notification pipe paired with the segment.
+
+        Nothing is sent while no reader has the pipe open, a full pipe already guarantees a
+        wakeup so the writer never blocks on it.
+
+        """
+        if os.name == 'nt':
+            return
+        if self.notify_fd is None:
+            # Opening the pipe fails while no reader waits, only try once a reader counted itself.
+            if not struct.unpack_from('@Q', self.sharedmem, self.meta.READERS_OFFSET)[0]:
+                return
+            try:
+                self.notify_fd = os.open(self.path + '.notify', os.O_WRONLY | os.O_NONBLOCK)
+            except OSError:
+                return
+        try:
+            os.write(self.notify_fd, b'\0')
+        except BlockingIOError:
+            pass
+        except OSError as exp:
+            if exp.errno != errno.EPIPE:
+                raise
+            os.close(self.notify_fd)
+            self.notify_fd = None
+
+    def _get_wakeup_fd(self):
+        """
+        Opens the notification pipe of the segment for reading.
+
+        The reader keeps a write end open as well, otherwise the pipe would report end of file
+        whenever no writer has it open.
+
+        """
+        if self.wakeup_fds is None:
+            name = self.path + '.notify'
+            try:
+                os.mkfifo(name, 0o600)
+            except FileExistsError:
+                pass
+            read_fd = os.open(name, os.O_RDONLY | os.O_NONBLOCK)
+            self.wakeup_fds = (read_fd, os.open(name, os.O_WRONLY | os.O_NONBLOCK))
+            self._add_waiting_readers(1)
+        return self.wakeup_fds[0]
+
+    def _add_waiting_readers(self, count):
+        """
+        Adds count to the number of readers waiting on the notification pipe. A reader that
+        dies without closing stays counted, writers then keep trying to open the pipe.
+
+        """
+        with self._lock_segment():
+            offset = self.meta.READERS_OFFSET
+            readers = struct.unpack('@Q', os.pread(self.fd, 8, offset))[0]
+            os.pwrite(self.fd, struct.pack('@Q', max(readers + count, 0)), offset)
+
+    def _drain_wakeup_fd(self):
+        try:
+            while os.read(self.wakeup_fds[0], 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def wait_for_data(self, timeout=None):
+        """
+        Blocks until objects are appended after the previous read, returns False if timeout
+        seconds pass first.
+
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if os.name == 'nt':
+            while not self._has_new_data():
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.001)
+            return True
+        wakeup_fd = self._get_wakeup_fd()
+        while not self._has_new_data():
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+            if select.select([wakeup_fd], [], [], remaining)[0]:
+                self._drain_wakeup_fd()
+        return True
+
+    async def wait_for_data_async(self, timeout=None):
+        """
+        Awaits objects appended after the previous read, returns False if timeout seconds pass
+        first. The event loop watches the notification pipe, no thread is blocked.
+
+        """
+        if os.name == 'nt':
+            return await asyncio.get_running_loop().run_in_executor(None, self.wait_for_data,
+                                                                    timeout)
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        wakeup_fd = self._get_wakeup_fd()
+        while not self._has_new_data():
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return False
+            readable = loop.create_future()
+            loop.add_reader(wakeup_fd, lambda: readable.done() or readable.set_result(None))
+            try:
+                await asyncio.wait_for(readable, remaining)
+                self._drain_wakeup_fd()
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                loop.remove_reader(wakeup_fd)
+        return True
+
+    def close(self):
+        """
+        Closes the notification pipe and the mapping, views handed out must be released first.
+        The files stay in place for other processes, see unlink.
+
+        """
+        if self.wakeup_fds is not None:
+            self._add_waiting_readers(-1)
+        for fd in ((self.wakeup_fds or ()) + ((self.notify_fd,) if self.notify_fd else ()) +
+                   ((self.lock_fd,) if self.lock_pid == os.getpid() else ()) +
+                   ((self.fd,) if self.fd is not None else ())):
+            os.close(fd)
+        self.wakeup_fds = None
+        self.notify_fd = None
+        self.lock_fd = None
+        self.lock_pid = None
+        self.fd = None
+        self.sharedmem.close()
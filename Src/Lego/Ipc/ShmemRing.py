@@ -0,0 +1,292 @@
+"""
+Single producer, single consumer ring buffer laid over mmap shared memory.
+
+"""
+import struct
+
+from Lego.Ipc.Shmem import Shmem, ShmemRecords
+
+class _ShmemRingMeta:
+    """
+    Implements the header for the ring buffer space.
+
+    The header holds the fixed size of the records, the number of slots and three monotonically
+    increasing sequence counters. The writer owns head and reserved, the reader owns tail, slot
+    of a record is its sequence number modulo the capacity. The writer moves reserved past the
+    records it is about to copy before copying them and head once they are in place. The
+    readers waiting on the notification pipe count themselves last.
+
+    """
+    FORMAT = '@IIQQQQ'
+    HEAD_OFFSET = struct.calcsize('@II')
+    TAIL_OFFSET = struct.calcsize('@IIQ')
+    RESERVED_OFFSET = struct.calcsize('@IIQQ')
+    READERS_OFFSET = struct.calcsize('@IIQQQ')
+
+    def __init__(self, size_of_objects=0, capacity=0):
+        """
+        Initializes header.
+
+        """
+        self.size_of_objects = size_of_objects
+        self.capacity = capacity
+        self.head = 0
+        self.tail = 0
+        self.reserved = 0
+        self.readers = 0
+
+    def get_bytes(self):
+        """
+        Converts this class into byte representation.
+
+        """
+        return struct.pack(self.FORMAT, self.size_of_objects, self.capacity, self.head, self.tail,
+                           self.reserved, self.readers)
+
+    def from_bytes(self, sbyte):
+        """
+        Loads this object from byte representation.
+
+        """
+        (self.size_of_objects, self.capacity, self.head, self.tail, self.reserved,
+         self.readers) = struct.unpack(self.FORMAT, sbyte)
+
+    def size_of_meta(self):
+        """
+        Returns size of meta table.
+
+        """
+        return struct.calcsize(self.FORMAT)
+
+    def __repr__(self):
+        return (str(self.head - self.tail) + ' of ' + str(self.capacity) + ' each of size ' +
+                str(self.size_of_objects))
+
+class ShmemRing(Shmem):
+    """
+    Inter process communication mechanism with bounded memory.
+
+    The writer never waits for the reader. When the writer laps the reader the oldest records
+    are lost and counted as overruns by the reader.
+
+    """
+    def __init__(self, taskid, record_size, child=True, overwrite=True, capacity=None,
+                 resume=False):
+        """
+        Initialize a ring of fixed size records in a shared memory block.
+
+        When overwrite is False the writer refuses new records while the ring is full instead
+        of overwriting records the reader has not consumed yet. The ring fills the default
+        segment size unless the writer asks for a capacity in records, readers take the
+        capacity from the header. A writer with resume set continues the sequence of a previous
+        writer of the same ring, for instance one that was restarted, instead of resetting it.
+
+        """
+        self.resume = resume
+        self.capacity = capacity
+        self.record_size = record_size
+        self.overwrite = overwrite
+        self.overruns = 0
+        self.tail = 0
+        size = Shmem.DEFAULT_SIZE
+        if capacity is not None:
+            size = _ShmemRingMeta().size_of_meta() + capacity * record_size
+        super(ShmemRing, self).__init__(taskid, child, size=size)
+
+    def _create_shmem(self, taskid, child):
+        # The reader needs write access as well to publish its tail.
+        self.sharedmem = self._map_shmem(taskid, child, writable=True)
+        self.meta = _ShmemRingMeta()
+        # An existing segment may be larger than the capacity asked for.
+        capacity = (self.size - self.meta.size_of_meta()) // self.record_size
+        if self.capacity is not None:
+            capacity = min(capacity, self.capacity)
+        if capacity < 1:
+            raise ValueError('Record size ' + str(self.record_size) + ' does not fit in ' +
+                             str(self.size) + ' bytes of shared memory')
+        if child is True:
+            previous = _ShmemRingMeta()
+            previous.from_bytes(self.sharedmem[0:previous.size_of_meta()])
+            self.meta = _ShmemRingMeta(self.record_size, capacity)
+            # Readers may already wait for the new writer.
+            self.meta.readers = previous.readers
+            if (self.resume and previous.size_of_objects == self.record_size and
+                    previous.capacity == capacity):
+                self.meta.head = previous.head
+                self.meta.tail = previous.tail
+                self.meta.reserved = previous.head
+            self.sharedmem[0:self.meta.size_of_meta()] = self.meta.get_bytes()
+        else:
+            self.meta.from_bytes(self.sharedmem[0:self.meta.size_of_meta()])
+            if self.meta.size_of_objects != self.record_size:
+                raise ValueError('Record size ' + str(self.record_size) +
+                                 ' does not match ring record size ' +
+                                 str(self.meta.size_of_objects))
+            self.tail = self.meta.tail
+        # struct.pack_into clears the bytes before packing, the other process could see a
+        # counter drop to zero. Items of a cast view are stored with a single copy.
+        self.counters = memoryview(self.sharedmem)[0:self.meta.size_of_meta()].cast('Q')
+
+    def _load_counter(self, offset):
+        return self.counters[offset // 8]
+
+    def _store_counter(self, offset, value):
+        self.counters[offset // 8] = value
+
+    def _slot_offset(self, sequence):
+        return self.meta.size_of_meta() + (sequence % self.meta.capacity) * self.record_size
+
+    def append_shmem(self, obj):
+        """
+        Appends a record to the ring, returns False if the ring is full and overwrite is off.
+
+        """
+        if len(obj) != self.record_size:
+            raise ValueError('Record of size ' + str(len(obj)) + ' in a ring of size ' +
+                             str(self.record_size))
+        head = self.meta.head
+        if not self.overwrite:
+            if head - self._load_counter(_ShmemRingMeta.TAIL_OFFSET) >= self.meta.capacity:
+                return False
+        # Readers copying the slot being overwritten learn it from reserved.
+        self._store_counter(_ShmemRingMeta.RESERVED_OFFSET, head + 1)
+        offset = self._slot_offset(head)
+        self.sharedmem[offset:offset + self.record_size] = obj
+        # Publish the record only once its payload is in place.
+        self.meta.head = head + 1
+        self._store_counter(_ShmemRingMeta.HEAD_OFFSET, self.meta.head)
+        self._notify()
+        return True
+
+    def append_many(self, objs, tag=0):
+        """
+        Appends a batch of records and publishes them with a single head update. When overwrite
+        is off only the records that fit are appended, otherwise at most the last capacity
+        records of the batch are kept. Returns the number of records appended.
+
+        """
+        del tag
+        objs = list(objs)
+        for obj in objs:
+            if len(obj) != self.record_size:
+                raise ValueError('Record of size ' + str(len(obj)) + ' in a ring of size ' +
+                                 str(self.record_size))
+        head = self.meta.head
+        count = len(objs)
+        if not self.overwrite:
+            count = min(count, self._load_counter(_ShmemRingMeta.TAIL_OFFSET) +
+                        self.meta.capacity - head)
+        elif count > self.meta.capacity:
+            # The first records of the batch would be overwritten by the last ones.
+            head += count - self.meta.capacity
+            objs = objs[count - self.meta.capacity:]
+            count = self.meta.capacity
+        if count <= 0:
+            return 0
+        # Readers copying slots being overwritten learn it from reserved.
+        self._store_counter(_ShmemRingMeta.RESERVED_OFFSET, head + count)
+        for sequence, obj in zip(range(head, head + count), objs):
+            offset = self._slot_offset(sequence)
+            self.sharedmem[offset:offset + self.record_size] = obj
+        appended = head + count - self.meta.head
+        self.meta.head = head + count
+        self._store_counter(_ShmemRingMeta.HEAD_OFFSET, self.meta.head)
+        self._notify()
+        return appended
+
+    def _has_new_data(self):
+        """
+        Returns True if records were appended since the previous read.
+
+        """
+        return self._load_counter(_ShmemRingMeta.HEAD_OFFSET) > self.tail
+
+    def _consume(self, release=True):
+        """
+        Advances the tail past all published records, returns the first and last sequence.
+        The tail is only published to the writer when release is set.
+
+        """
+        capacity = self.meta.capacity
+        head = self._load_counter(_ShmemRingMeta.HEAD_OFFSET)
+        # Records the writer started overwriting are lost as well.
+        reserved = self._load_counter(_ShmemRingMeta.RESERVED_OFFSET)
+        if reserved - self.tail > capacity:
+            self.overruns += reserved - self.tail - capacity
+            self.tail = reserved - capacity
+        start = self.tail
+        # The writer may have lapped the reader past the head loaded above, never move the tail
+        # back over records already counted as overruns.
+        head = max(head, start)
+        self.tail = head
+        if release:
+            self.release()
+        return start, head
+
+    def release(self):
+        """
+        Hands the slots of the records read so far back to the writer.
+
+        """
+        self._store_counter(_ShmemRingMeta.TAIL_OFFSET, self.tail)
+
+    def read_shmem(self):
+        """
+        Reads the records appended since the previous read.
+
+        """
+        start, head = self._consume(release=False)
+        objs = []
+        for sequence in range(start, head):
+            offset = self._slot_offset(sequence)
+            objs.append(self.sharedmem[offset:offset + self.record_size])
+        # Records the writer overwrote while they were being copied are torn, drop them. The
+        # writer reserves the slots of a batch before copying over any of them.
+        lapped = self._load_counter(_ShmemRingMeta.RESERVED_OFFSET) - self.meta.capacity
+        if lapped > start:
+            dropped = max(min(lapped, head) - start, 0)
+            self.overruns += dropped
+            objs = objs[dropped:]
+        self.release()
+        return objs
+
+    def read_views(self, release=True):
+        """
+        Reads the records appended since the previous read without copying them.
+
+        The views alias ring slots, decode them before the writer laps the reader. When release
+        is False a writer with overwrite off does not reuse the slots until release is called.
+
+        """
+        start, head = self._consume(release)
+        return ShmemRecords(memoryview(self.sharedmem), self.meta.size_of_meta(),
+                            self.record_size, start % self.meta.capacity, head - start,
+                            self.meta.capacity)
+
+    def read_record(self, position):
+        """
+        Reads record with sequence number position without copying, while it is still in the
+        ring.
+
+        """
+        head = self._load_counter(_ShmemRingMeta.HEAD_OFFSET)
+        reserved = self._load_counter(_ShmemRingMeta.RESERVED_OFFSET)
+        if position < max(reserved - self.meta.capacity, 0) or position >= head:
+            raise IndexError('Shmem ring sequence out of range')
+        offset = self._slot_offset(position)
+        return memoryview(self.sharedmem)[offset:offset + self.record_size]
+
+    def close(self):
+        """
+        Releases the view of the counters and closes the ring.
+
+        """
+        self.counters.release()
+        super(ShmemRing, self).close()
+
+    def get_overruns(self):
+        """
+        Returns number of records lost because the writer lapped the reader.
+
+        """
+        return self.overruns
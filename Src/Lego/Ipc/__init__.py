@@ -3,4 +3,5 @@ Module export for different IPC implementations.
 
 """
 
-from Lego.Ipc.Shmem import Shmem
+from Lego.Ipc.Shmem import Shmem, ShmemFrames, ShmemRecords
+from Lego.Ipc.ShmemRing import ShmemRing
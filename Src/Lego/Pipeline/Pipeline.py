@@ -0,0 +1,206 @@
+"""
+Chains plugins into a pipeline whose stages stream data to each other through bounded queues.
+
+"""
+import inspect
+import queue
+import threading
+
+from Lego.Diagnostics import Tracer
+from Lego.PluginBase.PluginBase import PluginBase
+from Lego.PluginBase.streaming import chunked, unchunked
+
+_END_OF_STREAM = object()
+
+class PipelineAborted(Exception):
+    """
+    Raised inside stages when another stage of the pipeline failed.
+
+    """
+
+class _Channel:
+    """
+    Bounded queue of chunks feeding one stage from all of its upstream stages.
+
+    """
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, size, producers, aborted):
+        """
+        Builds the channel, it ends once each of producers has closed it.
+
+        """
+        self.items = queue.Queue(maxsize=size)
+        self.open_producers = producers
+        self.aborted = aborted
+
+    def put(self, item):
+        """
+        Sends an item, waits while the consumer is behind.
+
+        """
+        while True:
+            if self.aborted.is_set():
+                raise PipelineAborted()
+            try:
+                self.items.put(item, timeout=self.POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def close(self):
+        """
+        Tells the consumer one producer is done.
+
+        """
+        self.put(_END_OF_STREAM)
+
+    def __iter__(self):
+        while self.open_producers:
+            if self.aborted.is_set():
+                raise PipelineAborted()
+            try:
+                item = self.items.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if item is _END_OF_STREAM:
+                self.open_producers -= 1
+            else:
+                yield item
+
+class Pipeline:
+    """
+    Directed acyclic graph of plugin stages.
+
+    Every stage runs its plugin's run function in a thread of its own, so independent branches
+    run concurrently. A stage with upstream stages gets their outputs as an iterable inputs
+    keyword argument, a stage with downstream stages returns an iterable of outputs, each one is
+    sent to every downstream stage. Queues between stages are bounded, a slow stage makes its
+    upstream stages wait.
+
+    Outputs travel between stages in chunks of chunk_size records, stages whose plugin sets a
+    chunk_size of its own get their inputs as chunks of that size. Smaller chunks lower latency
+    and memory, larger ones lower the cost per record.
+
+    """
+    def __init__(self, group=None, queue_size=64, chunk_size=256):
+        """
+        Builds an empty pipeline, stages given by name are looked up in group.
+
+        """
+        self.group = group
+        self.queue_size = queue_size
+        self.chunk_size = chunk_size
+        self.stages = {}
+        self.dependencies = {}
+
+    def _resolve(self, plugin):
+        if isinstance(plugin, str):
+            candidate = PluginBase.get_plugin(self.group, plugin)
+            if candidate is not None:
+                return candidate
+            raise LookupError('No plugin ' + plugin + ' registered in group ' + str(self.group))
+        return plugin
+
+    def add_stage(self, plugin, depends_on=()):
+        """
+        Adds a plugin, or the name of one, fed by the stages it depends on.
+
+        """
+        plugin = self._resolve(plugin)
+        name = plugin.get_plugin_name()
+        if name in self.stages:
+            raise ValueError('Stage ' + name + ' is already in the pipeline')
+        self.stages[name] = plugin
+        self.dependencies[name] = [self._resolve(dependency).get_plugin_name()
+                                   for dependency in depends_on]
+        return self
+
+    def get_order(self):
+        """
+        Returns the stage names in dependency order.
+
+        """
+        pending = {name: set(dependencies) for name, dependencies in self.dependencies.items()}
+        for name, dependencies in pending.items():
+            for dependency in dependencies:
+                if dependency not in self.stages:
+                    raise ValueError('Stage ' + name + ' depends on unknown stage ' + dependency)
+        order = []
+        while pending:
+            ready = sorted(name for name, dependencies in pending.items() if not dependencies)
+            if not ready:
+                raise ValueError('Pipeline stages depend on each other: ' +
+                                 ', '.join(sorted(pending)))
+            for name in ready:
+                del pending[name]
+                for dependencies in pending.values():
+                    dependencies.discard(name)
+            order.extend(ready)
+        return order
+
+    def run(self):
+        """
+        Runs all stages to completion, returns the result of every stage without downstream
+        stages by name. Raises the first exception a stage failed with.
+
+        """
+        order = self.get_order()
+        aborted = threading.Event()
+        consumers = {name: [] for name in order}
+        for name in order:
+            for dependency in self.dependencies[name]:
+                consumers[dependency].append(name)
+        channels = {name: _Channel(self.queue_size, len(self.dependencies[name]), aborted)
+                    for name in order if self.dependencies[name]}
+        results = {}
+        errors = []
+
+        def run_stage(name):
+            plugin = self.stages[name]
+            outputs = [channels[consumer] for consumer in consumers[name]]
+            try:
+                if Tracer.enabled:
+                    Tracer.record('enter', 'pipeline stage', name)
+                func = inspect.unwrap(type(plugin).run)
+                if name in channels:
+                    inputs = unchunked(channels[name])
+                    if plugin.chunk_size:
+                        inputs = chunked(inputs, plugin.chunk_size)
+                    result = func(plugin, inputs=inputs)
+                else:
+                    result = func(plugin)
+                if outputs:
+                    for chunk in chunked(result or (), self.chunk_size):
+                        for channel in outputs:
+                            channel.put(chunk)
+                elif inspect.isgenerator(result):
+                    for _ in result:
+                        pass
+                else:
+                    results[name] = result
+                if name in channels:
+                    # Inputs the stage left unread would keep upstream stages waiting.
+                    for _ in channels[name]:
+                        pass
+                for channel in outputs:
+                    channel.close()
+                if Tracer.enabled:
+                    Tracer.record('exit', 'pipeline stage', name)
+            except PipelineAborted:
+                pass
+            except BaseException as exp:
+                if Tracer.enabled:
+                    Tracer.record('exception', 'pipeline stage', name, repr(exp))
+                errors.append(exp)
+                aborted.set()
+
+        threads = [threading.Thread(target=run_stage, args=(name,), name='pipeline-' + name)
+                   for name in order]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return results
@@ -0,0 +1,5 @@
+"""
+Exports from pipeline.
+
+"""
+from Lego.Pipeline.Pipeline import Pipeline, PipelineAborted
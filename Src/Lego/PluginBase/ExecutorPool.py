@@ -0,0 +1,188 @@
+"""
+Shared bounded executors that plugin runs are submitted to.
+
+"""
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import BrokenExecutor, ThreadPoolExecutor, ProcessPoolExecutor
+
+class BoundedExecutor:
+    """
+    Wraps an executor so that submitting blocks once max_pending tasks are queued or running,
+    producers are slowed down instead of queueing without limit.
+
+    The executor is flagged broken once a task fails because a worker process died, for
+    instance when a plugin cannot be unpickled, it takes no new task afterwards.
+
+    """
+    def __init__(self, executor, max_pending):
+        """
+        Builds the bounded executor.
+
+        """
+        self.executor = executor
+        self.max_pending = max_pending
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.broken = False
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Submits a task, waits for a free slot first.
+
+        """
+        self.pending.acquire()
+        try:
+            future = self.executor.submit(func, *args, **kwargs)
+        except BrokenExecutor:
+            self.broken = True
+            self.pending.release()
+            raise
+        except BaseException:
+            self.pending.release()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        self.pending.release()
+        if not future.cancelled() and isinstance(future.exception(), BrokenExecutor):
+            self.broken = True
+
+    def shutdown(self, wait=True):
+        """
+        Shuts down the wrapped executor.
+
+        """
+        self.executor.shutdown(wait=wait)
+
+class ExecutorPool:
+    """
+    Registry of the executors shared by all plugins, one per kind of workload.
+
+    'thread' suits I/O bound plugins, 'process' suits CPU bound plugins. Plugins choose one with
+    their executor class attribute. Plugins with an async run share one event loop running in a
+    thread of its own, with at most MAX_COROUTINES_PER_GROUP runs of a group at a time.
+
+    """
+    MAX_WORKERS = {
+        'thread': min(32, (os.cpu_count() or 1) + 4),
+        'process': os.cpu_count() or 1,
+    }
+    MAX_PENDING_PER_WORKER = 4
+    MAX_COROUTINES_PER_GROUP = 1024
+    executors = {}
+    sizes = {}
+    lock = threading.Lock()
+    loop = None
+    group_limits = {}
+    group_semaphores = {}
+
+    @classmethod
+    def _create_executor(cls, kind, max_workers):
+        if kind == 'thread':
+            return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='plugin')
+        if kind == 'process':
+            # Plugins are loaded from source files and cannot be imported again by name, forked
+            # workers inherit them.
+            context = None
+            if 'fork' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('fork')
+            return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+        raise ValueError('Unknown executor kind ' + str(kind))
+
+    @classmethod
+    def configure(cls, kind, max_workers, max_pending=None):
+        """
+        Replaces the executor of a kind with one of the given size.
+
+        """
+        if max_pending is None:
+            max_pending = max_workers * cls.MAX_PENDING_PER_WORKER
+        executor = BoundedExecutor(cls._create_executor(kind, max_workers), max_pending)
+        with cls.lock:
+            previous = cls.executors.get(kind)
+            cls.executors[kind] = executor
+            cls.sizes[kind] = (max_workers, max_pending)
+        if previous is not None:
+            previous.shutdown(wait=False)
+        return executor
+
+    @classmethod
+    def get_executor(cls, kind):
+        """
+        Returns the executor of a kind, creating it on first use and again once it is broken.
+
+        """
+        executor = cls.executors.get(kind)
+        if executor is None or executor.broken:
+            previous = None
+            with cls.lock:
+                executor = cls.executors.get(kind)
+                if executor is None or executor.broken:
+                    previous = executor
+                    max_workers = cls.MAX_WORKERS[kind]
+                    max_workers, max_pending = cls.sizes.get(
+                        kind, (max_workers, max_workers * cls.MAX_PENDING_PER_WORKER))
+                    executor = BoundedExecutor(cls._create_executor(kind, max_workers),
+                                               max_pending)
+                    cls.executors[kind] = executor
+            if previous is not None:
+                previous.shutdown(wait=False)
+        return executor
+
+    @classmethod
+    def get_event_loop(cls):
+        """
+        Returns the event loop shared by async plugins, starting it on first use.
+
+        """
+        loop = cls.loop
+        if loop is None:
+            with cls.lock:
+                loop = cls.loop
+                if loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='plugin-event-loop',
+                                     daemon=True).start()
+                    cls.loop = loop
+        return loop
+
+    @classmethod
+    def set_group_concurrency(cls, group, limit):
+        """
+        Limits how many async runs of plugins of a group run at a time, runs submitted earlier
+        keep the previous limit.
+
+        """
+        cls.group_limits[group] = limit
+        cls.group_semaphores.pop(group, None)
+
+    @classmethod
+    def get_group_semaphore(cls, group):
+        """
+        Returns the semaphore limiting async runs of a group, only call it on the event loop.
+
+        """
+        semaphore = cls.group_semaphores.get(group)
+        if semaphore is None:
+            limit = cls.group_limits.get(group, cls.MAX_COROUTINES_PER_GROUP)
+            semaphore = cls.group_semaphores[group] = asyncio.Semaphore(limit)
+        return semaphore
+
+    @classmethod
+    def shutdown(cls, wait=True):
+        """
+        Shuts down all executors and the event loop.
+
+        """
+        with cls.lock:
+            executors = list(cls.executors.values())
+            cls.executors.clear()
+            loop, cls.loop = cls.loop, None
+            cls.group_semaphores.clear()
+        for executor in executors:
+            executor.shutdown(wait=wait)
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
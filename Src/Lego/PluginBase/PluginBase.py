@@ -5,6 +5,12 @@ the plugins do not have to explicitly register.
 """
 
 import abc
+import asyncio
+import importlib
+import importlib.util
+import inspect
+import sys
+import threading
 
 from marshmallow_jsonschema import JSONSchema
 from Lego.Datatypes import InputParams
@@ -12,14 +18,68 @@ from .decorators import check_chart_configuration
 from .decorators import check_input_configuration
 from .decorators import check_modes_of_operation
 from .decorators import run_async
+from .decorators import run_coroutine
+from .PluginRegistry import PluginRegistry
+from .streaming import achunked, chunked
 # Plugin implementation
 
+def _import_plugin(group, name, module, qualname, path):
+    """
+    Imports the module of a plugin the process does not know, by name or else from its source
+    file, and returns the plugin. Modules usually create their plugins when imported, otherwise
+    the plugin class is instantiated under group and name.
+
+    """
+    plugin_module = sys.modules.get(module)
+    if plugin_module is None:
+        try:
+            plugin_module = importlib.import_module(module)
+        except ImportError:
+            if path is None:
+                raise
+            spec = importlib.util.spec_from_file_location(module, path)
+            plugin_module = importlib.util.module_from_spec(spec)
+            sys.modules[module] = plugin_module
+            spec.loader.exec_module(plugin_module)
+    plugin = PluginBase.get_plugin(group, name)
+    if plugin is None:
+        cls = plugin_module
+        for attr in qualname.split('.'):
+            cls = getattr(cls, attr)
+        plugin = cls(name, group)
+    return plugin
+
+def _get_registered_plugin(group, name, module=None, qualname=None, path=None):
+    """
+    Returns the plugin instance registered under group and name. A worker process forked
+    before the plugin was registered imports its module again.
+
+    """
+    plugin = PluginBase.get_plugin(group, name)
+    if plugin is None and module is not None:
+        plugin = _import_plugin(group, name, module, qualname, path)
+    if plugin is not None:
+        return plugin
+    raise LookupError('No plugin ' + str(name) + ' registered in group ' + str(group))
+
 class PluginBase(metaclass=abc.ABCMeta):
     """
     The base class for all plugins that want to register with this application.
 
+    Plugins run on the shared 'thread' executor, CPU bound plugins set executor to 'process'.
+    Plugins with an async def run are scheduled on a shared event loop instead.
+
+    Streaming plugins take an inputs iterable in run and return or yield their outputs. Plugins
+    that set chunk_size get their inputs as lists of at most chunk_size records instead of one
+    record at a time.
+
     """
-    plugin_registry = {}
+    plugin_registry = PluginRegistry()
+    plugin_sources = {}
+    plugin_sources_lock = threading.RLock()
+    input_configurations = None
+    executor = 'thread'
+    chunk_size = None
     def __init__(self, name, group):
         """
         Constructor to initialize basic fields.
@@ -28,6 +88,7 @@ class PluginBase(metaclass=abc.ABCMeta):
         self.name = name
         self.group = group
         self.input_params = InputParams()
+        self.input_configuration = None
 
     def __new__(cls, name, group, *args, **kwargs):
         """
@@ -38,11 +99,21 @@ class PluginBase(metaclass=abc.ABCMeta):
         del kwargs
         instance = object.__new__(cls)
         # Call base class constructors by default to avoid doing them in each plugin.
-        super(cls, instance).__init__(name, group)
+        PluginBase.__init__(instance, name, group)
+        cls.plugin_registry.register(instance)
+        return instance
+
+    def __init_subclass__(cls, **kwargs):
+        """
+        Decorates the plugin functions once, when the plugin class is created. Functions that are
+        decorated already keep their single wrapper.
+
+        """
+        super().__init_subclass__(**kwargs)
         typedef = cls.__dict__
-        for attr in typedef:
+        for attr in list(typedef):
             func = typedef[attr]
-            if hasattr(func, "__dont_decorate__"):
+            if hasattr(func, "__dont_decorate__") or hasattr(func, "__decorated__"):
                 pass
             elif callable(func) and func.__name__ == 'get_input_configuration':
                 setattr(cls, attr, check_input_configuration(func))
@@ -50,13 +121,98 @@ class PluginBase(metaclass=abc.ABCMeta):
                 setattr(cls, attr, check_chart_configuration(func))
             elif callable(func) and func.__name__ == 'get_modes_of_operation':
                 setattr(cls, attr, check_modes_of_operation(func))
+            elif callable(func) and func.__name__ == 'run' and inspect.iscoroutinefunction(func):
+                setattr(cls, attr, run_coroutine(func))
             elif callable(func) and func.__name__ == 'run':
                 setattr(cls, attr, run_async(func))
 
-        if group not in cls.plugin_registry.keys():
-            cls.plugin_registry[group] = []
-        cls.plugin_registry[group].append(instance)
-        return instance
+    def __reduce__(self):
+        """
+        Plugins are pickled by reference to the registry, a worker process forked after the
+        plugins were loaded resolves them to its own copy. The module, class and source file
+        of the plugin come along for workers forked before it was registered.
+
+        """
+        cls = type(self)
+        path = getattr(sys.modules.get(cls.__module__), '__file__', None)
+        return (_get_registered_plugin, (self.group, self.name, cls.__module__,
+                                         cls.__qualname__, path))
+
+    @classmethod
+    def add_plugin_source(cls, group, name, loader):
+        """
+        Announces a plugin that is registered once loader is called, on first use of its group.
+        Plugins of an unknown group are announced with group None and loaded on first use of any
+        group.
+
+        """
+        with cls.plugin_sources_lock:
+            cls.plugin_sources.setdefault(group, {})[name] = loader
+
+    @classmethod
+    def _load_plugin_sources(cls, groups):
+        """
+        Calls the loaders announced for the groups, each one only once.
+
+        """
+        with cls.plugin_sources_lock:
+            for group in groups:
+                for loader in cls.plugin_sources.pop(group, {}).values():
+                    loader()
+
+    @classmethod
+    def get_plugin_index(cls):
+        """
+        Gets the names of all plugins by group, registered or only announced, without loading
+        any of them.
+
+        """
+        with cls.plugin_sources_lock:
+            index = {group: [plugin.name for plugin in plugins]
+                     for group, plugins in cls.plugin_registry.items()}
+            for group, sources in cls.plugin_sources.items():
+                if group is not None:
+                    index.setdefault(group, []).extend(sources.keys())
+        return index
+
+    async def arun(self, *args, **kwargs):
+        """
+        Awaitable run for callers on any event loop, async plugins run on the shared event loop
+        and the others on their executor.
+
+        """
+        return await asyncio.wrap_future(self.run(*args, **kwargs))
+
+    def stream(self, inputs=None, chunk_size=None):
+        """
+        Runs the plugin in the calling thread over an iterable of records, for instance decoded
+        RuntimeMonitorParams objects or Shmem views, and returns an iterator of its outputs.
+        Records are pulled only as the outputs are consumed.
+
+        """
+        func = inspect.unwrap(type(self).run)
+        chunk_size = chunk_size or self.chunk_size
+        if inputs is None:
+            outputs = func(self)
+        elif chunk_size:
+            outputs = func(self, inputs=chunked(inputs, chunk_size))
+        else:
+            outputs = func(self, inputs=iter(inputs))
+        return iter(outputs or ())
+
+    async def astream(self, inputs=None, chunk_size=None):
+        """
+        Async iterator over the outputs of a plugin whose run is an async generator, inputs may
+        be an async iterable.
+
+        """
+        func = inspect.unwrap(type(self).run)
+        chunk_size = chunk_size or self.chunk_size
+        if inputs is not None and chunk_size:
+            inputs = achunked(inputs, chunk_size)
+        outputs = func(self) if inputs is None else func(self, inputs=inputs)
+        async for output in outputs:
+            yield output
 
     @classmethod
     def get_plugins(cls):
@@ -64,14 +220,59 @@ class PluginBase(metaclass=abc.ABCMeta):
         Gets the list of all plugins registered.
 
         """
+        if cls.plugin_sources:
+            cls._load_plugin_sources(list(cls.plugin_sources.keys()))
         return cls.plugin_registry
 
+    @classmethod
+    def unregister_plugin(cls, plugin):
+        """
+        Removes a plugin from the registry.
+
+        """
+        cls.plugin_registry.unregister(plugin)
+
+    @classmethod
+    def get_plugin(cls, group, name):
+        """
+        Gets the plugin registered under group and name, None if there is none.
+
+        """
+        if group in cls.plugin_sources or None in cls.plugin_sources:
+            cls._load_plugin_sources([None, group])
+        return cls.plugin_registry.find(group, name)
+
+    @classmethod
+    def get_plugins_by_name(cls, name):
+        """
+        Gets the plugins registered under a name in any group.
+
+        """
+        if cls.plugin_sources:
+            cls._load_plugin_sources(list(cls.plugin_sources.keys()))
+        return cls.plugin_registry.find_by_name(name)
+
+    @classmethod
+    def get_plugins_by_mode(cls, mode, group=None):
+        """
+        Gets the plugins supporting a mode of operation, online or offline, optionally only
+        those of a group.
+
+        """
+        if group is None and cls.plugin_sources:
+            cls._load_plugin_sources(list(cls.plugin_sources.keys()))
+        elif group in cls.plugin_sources or None in cls.plugin_sources:
+            cls._load_plugin_sources([None, group])
+        return cls.plugin_registry.find_by_mode(mode, group)
+
     @classmethod
     def get_plugins_group(cls, group):
         """
         Gets plugins registered under a single group name.
 
         """
+        if group in cls.plugin_sources or None in cls.plugin_sources:
+            cls._load_plugin_sources([None, group])
         if not group in cls.plugin_registry.keys():
             return None
         return cls.plugin_registry[group]
@@ -93,12 +294,51 @@ class PluginBase(metaclass=abc.ABCMeta):
     def get_input_configuration(self):
         """
         Get name and type json value for input parameters required by this plugin to operate.
+        The json is cached until the input parameters change and shared with every caller, it
+        must not be modified.
+
+        """
+        version = self.input_params.version
+        if self.input_configuration is None or self.input_configuration[0] != version:
+            json_schema = JSONSchema()
+            schema_blue_print = self.input_params.generate_schema(self.name + 'InputParams')
+            schema_desc = schema_blue_print()
+            self.input_configuration = (version, json_schema.dump(schema_desc).data)
+        return self.input_configuration[1]
+
+    def validate_input(self, arguments):
+        """
+        Validates run arguments against the input parameters, returns the errors by field name.
+
+        """
+        return self.input_params.validate(arguments)
+
+    def validate_inputs(self, arguments_list):
+        """
+        Validates the run arguments of many queued runs, returns the errors of each one.
+
+        """
+        return self.input_params.validate_many(arguments_list)
+
+    @classmethod
+    def get_input_configurations(cls):
+        """
+        Gets the input configuration of every plugin by group and plugin name. The map is built
+        again only once plugins were registered or removed or their input parameters changed,
+        it must not be modified.
 
         """
-        json_schema = JSONSchema()
-        schema_blue_print = self.input_params.generate_schema(self.name + 'InputParams')
-        schema_desc = schema_blue_print()
-        return json_schema.dump(schema_desc).data
+        registry = cls.get_plugins()
+        versions = tuple(plugin.input_params.version for plugins in registry.values()
+                         for plugin in plugins)
+        cached = PluginBase.input_configurations
+        if cached is None or cached[0] != registry.version or cached[1] != versions:
+            configurations = {group: {plugin.name: plugin.get_input_configuration()
+                                      for plugin in plugins}
+                              for group, plugins in registry.items()}
+            cached = PluginBase.input_configurations = (registry.version, versions,
+                                                        configurations)
+        return cached[2]
 
     @abc.abstractmethod
     def get_chart_configuration(self):
@@ -119,7 +359,7 @@ class PluginBase(metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def run(self):
         """
-        Run method to call for the plugin processing.
+        Run method to call for the plugin processing. Calls return a Future of the result.
 
         """
         print("Running abstract method")
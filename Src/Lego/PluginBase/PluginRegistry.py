@@ -0,0 +1,115 @@
+"""
+Registry of plugin instances indexed by group, name and mode of operation.
+
+"""
+import threading
+
+class PluginRegistry(dict):
+    """
+    Dict of group to list of plugins, as returned by PluginBase.get_plugins, with secondary
+    indexes so that plugins are found without scanning every instance.
+
+    Plugins are registered before their own constructor runs, their modes of operation are
+    asked once, on the first lookup by mode after their registration, and cached. Modes are
+    matched without regard to case, plugins declare 'online' as well as 'Online'.
+
+    """
+    def __init__(self):
+        """
+        Builds an empty registry.
+
+        """
+        super(PluginRegistry, self).__init__()
+        self.lock = threading.RLock()
+        self.by_key = {}
+        self.by_name = {}
+        self.by_mode = {}
+        self.modes = {}
+        self.unindexed_modes = []
+        # Changes on every registration and removal, for caches derived from the registry.
+        self.version = 0
+
+    def register(self, plugin):
+        """
+        Adds a plugin to its group and to the indexes.
+
+        """
+        with self.lock:
+            self.setdefault(plugin.group, []).append(plugin)
+            self.by_key.setdefault((plugin.group, plugin.name), []).append(plugin)
+            self.by_name.setdefault(plugin.name, []).append(plugin)
+            self.unindexed_modes.append(plugin)
+            self.version += 1
+
+    def unregister(self, plugin):
+        """
+        Removes a plugin from its group and from the indexes.
+
+        """
+        with self.lock:
+            self._discard(self, plugin.group, plugin)
+            self._discard(self.by_key, (plugin.group, plugin.name), plugin)
+            self._discard(self.by_name, plugin.name, plugin)
+            for mode in self.modes.pop(id(plugin), ()):
+                self._discard(self.by_mode, mode, plugin)
+            if plugin in self.unindexed_modes:
+                self.unindexed_modes.remove(plugin)
+            self.version += 1
+
+    @staticmethod
+    def _discard(index, key, plugin):
+        plugins = index.get(key)
+        if plugins is None or plugin not in plugins:
+            return
+        plugins.remove(plugin)
+        if not plugins:
+            del index[key]
+
+    def _index_modes(self):
+        with self.lock:
+            while self.unindexed_modes:
+                plugin = self.unindexed_modes.pop(0)
+                modes = []
+                for mode in plugin.get_modes_of_operation() or ():
+                    if mode.lower() not in modes:
+                        modes.append(mode.lower())
+                modes = tuple(modes)
+                self.modes[id(plugin)] = modes
+                for mode in modes:
+                    self.by_mode.setdefault(mode, []).append(plugin)
+
+    def find(self, group, name):
+        """
+        Returns the first plugin registered under group and name, None if there is none.
+
+        """
+        plugins = self.by_key.get((group, name))
+        return plugins[0] if plugins else None
+
+    def find_by_name(self, name):
+        """
+        Returns the plugins registered under a name in any group.
+
+        """
+        return list(self.by_name.get(name, ()))
+
+    def find_by_mode(self, mode, group=None):
+        """
+        Returns the plugins supporting a mode of operation, only those of group if given.
+
+        """
+        if self.unindexed_modes:
+            self._index_modes()
+        plugins = self.by_mode.get(mode.lower(), ())
+        if group is None:
+            return list(plugins)
+        return [plugin for plugin in plugins if plugin.group == group]
+
+    def get_modes(self, plugin):
+        """
+        Returns the cached modes of operation of a registered plugin, in lower case.
+
+        """
+        if self.unindexed_modes:
+            self._index_modes()
+        return self.modes.get(id(plugin), ())
@@ -0,0 +1,171 @@
+"""
+Runs a plugin in a supervised worker process that streams its outputs back over shared memory.
+
+"""
+import time
+import inspect
+import threading
+import multiprocessing
+
+from Lego.Diagnostics import Tracer
+from Lego.Ipc import ShmemRing
+
+def _publish(channel, records):
+    """
+    Appends records to the channel, waits while it is full so no record is lost.
+
+    """
+    while records:
+        records = records[channel.append_many(records):]
+        if records:
+            time.sleep(0.001)
+
+def _worker_main(plugin, monitor, taskid, capacity, chunk_size, repeat):
+    """
+    Entry point of the worker process, publishes every output of the plugin's run as a record
+    of the monitor layout. Outputs produced before a failure are still published.
+
+    """
+    channel = ShmemRing(taskid, monitor.get_size(), overwrite=False, capacity=capacity,
+                        resume=True)
+    func = inspect.unwrap(type(plugin).run)
+    while True:
+        records = []
+        try:
+            for output in func(plugin) or ():
+                records.append(monitor.serialize(output))
+                if len(records) >= chunk_size:
+                    _publish(channel, records)
+                    records = []
+        finally:
+            _publish(channel, records)
+        if not repeat:
+            return
+
+class ProcessWorker:
+    """
+    Runs the run function of a plugin in a persistent worker process, outside of the GIL of the
+    parent. The run function returns or yields tuples of a RuntimeMonitorParams layout, they are
+    published on a ShmemRing channel the parent reads from. A worker that fails is started again,
+    waiting longer after each failure, up to max_restarts times.
+
+    """
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, plugin, monitor, taskid, capacity=4096, chunk_size=256, repeat=False,
+                 max_restarts=5, restart_delay=0.5):
+        """
+        Builds the worker, run is called again each time it returns while repeat is set.
+
+        """
+        self.plugin = plugin
+        self.monitor = monitor
+        self.taskid = taskid
+        self.capacity = capacity
+        self.chunk_size = chunk_size
+        self.repeat = repeat
+        self.max_restarts = max_restarts
+        self.restart_delay = restart_delay
+        self.restarts = 0
+        self.process = None
+        self.supervisor = None
+        self.stopping = threading.Event()
+        # The worker resumes the ring, create it empty before the reader attaches.
+        ShmemRing(taskid, monitor.get_size(), capacity=capacity).close()
+        self.channel = ShmemRing(taskid, monitor.get_size(), child=False)
+
+    def _spawn(self):
+        # Plugins are loaded from source files and cannot be imported again by name, forked
+        # workers inherit them.
+        context = multiprocessing
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        self.process = context.Process(target=_worker_main,
+                                       args=(self.plugin, self.monitor, self.taskid,
+                                             self.capacity, self.chunk_size, self.repeat),
+                                       name='plugin-worker-' + self.plugin.name, daemon=True)
+        self.process.start()
+
+    def _supervise(self):
+        while not self.stopping.is_set():
+            self.process.join(self.POLL_INTERVAL)
+            if self.process.is_alive() or self.stopping.is_set():
+                continue
+            if self.process.exitcode == 0 and not self.repeat:
+                return
+            if self.restarts >= self.max_restarts:
+                return
+            if Tracer.enabled:
+                Tracer.record('restart', 'worker', self.plugin.name, self.process.exitcode)
+            if self.stopping.wait(self.restart_delay * 2 ** self.restarts):
+                return
+            self.restarts += 1
+            self._spawn()
+
+    def start(self):
+        """
+        Starts the worker process and its supervisor.
+
+        """
+        self.stopping.clear()
+        self._spawn()
+        self.supervisor = threading.Thread(target=self._supervise, daemon=True,
+                                           name='plugin-supervisor-' + self.plugin.name)
+        self.supervisor.start()
+        return self
+
+    def is_alive(self):
+        """
+        Returns True while the worker runs or may still be restarted.
+
+        """
+        return self.supervisor is not None and self.supervisor.is_alive()
+
+    def wait_for_data(self, timeout=None):
+        """
+        Blocks until the worker published outputs that were not read yet.
+
+        """
+        return self.channel.wait_for_data(timeout)
+
+    def read(self):
+        """
+        Returns the outputs published since the previous read, decoded.
+
+        """
+        deserialize = self.monitor.deserialize
+        # Array and struct fields decode to views of the record, copy it out of the ring before
+        # the worker may reuse the slot.
+        outputs = [deserialize(bytes(view)) for view in self.channel.read_views(release=False)]
+        self.channel.release()
+        return outputs
+
+    def read_array(self):
+        """
+        Returns the outputs published since the previous read as a NumPy structured array.
+
+        """
+        array = self.monitor.deserialize_many(self.channel.read_views(release=False)).copy()
+        self.channel.release()
+        return array
+
+    def stop(self, timeout=None):
+        """
+        Stops the worker process and its supervisor.
+
+        """
+        self.stopping.set()
+        if self.supervisor is not None:
+            self.supervisor.join(timeout)
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+
+    def close(self, timeout=None):
+        """
+        Stops the worker and removes the files of its channel, outputs not read yet are lost.
+
+        """
+        self.stop(timeout)
+        self.channel.close()
+        ShmemRing.unlink(self.taskid)
@@ -1,54 +1,114 @@
 """
-Runs a task as an asynchronous thread with callback handler for database update.
+Runs a task on a shared executor with callback handler for database update.
 
 """
-from threading import Thread
+import time
+import asyncio
+import inspect
+import reprlib
+from concurrent.futures import ProcessPoolExecutor
+from Lego.Diagnostics import Metrics, Tracer
 
-class TaskRunner(Thread):
+def _run_in_process(obj, function_name, args, kwargs):
+    """
+    Runs a plugin function in a worker process. The decorated function cannot be pickled, the
+    original one is looked up again on the class of the plugin.
+
+    """
+    func = inspect.unwrap(getattr(type(obj), function_name))
+    return func(obj, *args, **kwargs)
+
+class TaskRunner:
     """
     Defines class task runner that runs an asynchronous task and registers callbacks.
 
     """
-    def __init__(self, obj, run_function, **kwargs):
+    def __init__(self, obj, run_function, *args, **kwargs):
         """
         Builds the task runner object.
 
         """
-        #Assign all kwargs to the member variables.
-        # self.__dict__.update(kwargs)
-        # for (key, val) in kwargs.items():
-        #     setattr(self, key, val)
         self.task_arguments = kwargs
+        self.task_positional_arguments = args
         # UGLY: The object that owns the function needs to be called in the context of that object.
         self.obj = obj
         self.run_function = run_function
-        super(TaskRunner, self).__init__()
-        print("Initialized the task")
+        self.series = None
+        self.submitted = None
+        self.started = None
 
     def run(self):
         """
-        Run the task.
+        Run the task in the calling thread and return its result.
+
+        """
+        if self.series is not None:
+            self.series.started(self.submitted)
+            self.started = time.perf_counter()
+        if Tracer.enabled:
+            Tracer.record('enter', 'run', self.obj.name)
+        return self.run_function(self.obj, *self.task_positional_arguments, **self.task_arguments)
+
+    def submit(self, executor):
+        """
+        Submits the task to an executor and returns the Future of its result.
+
+        Metrics of runs in worker processes only have the latency from submission to completion.
+
+        """
+        if Metrics.enabled:
+            self.series = Metrics.get_series(self.obj.group, self.obj.name, 'run')
+            self.submitted = self.series.submitted()
+        if isinstance(getattr(executor, 'executor', executor), ProcessPoolExecutor):
+            future = executor.submit(_run_in_process, self.obj, self.run_function.__name__,
+                                     self.task_positional_arguments, self.task_arguments)
+        else:
+            future = executor.submit(self.run)
+        future.add_done_callback(self._done)
+        return future
+
+    async def _run_coroutine(self, semaphore_of):
+        async with semaphore_of(self.obj.group):
+            return await self.run()
+
+    def submit_coroutine(self, loop, semaphore_of):
+        """
+        Schedules an async task on an event loop, at most as many tasks of a group run at a time
+        as the semaphore returned by semaphore_of(group) allows. Returns the Future of its result.
 
         """
-        try:
-            func = self.run_function
-            func(self=self.obj)
-            self.success_callback()
-        except BaseException as exp:
-            print(str(exp))
-            self.failure_callback()
+        if Metrics.enabled:
+            self.series = Metrics.get_series(self.obj.group, self.obj.name, 'run')
+            self.submitted = self.series.submitted()
+        future = asyncio.run_coroutine_threadsafe(self._run_coroutine(semaphore_of), loop)
+        future.add_done_callback(self._done)
+        return future
 
+    def _done(self, future):
+        if future.cancelled():
+            if self.series is not None:
+                self.series.cancelled()
+            return
+        exp = future.exception()
+        if self.series is not None:
+            self.series.finished(self.started or self.submitted, failed=exp is not None)
+        if exp is None:
+            self.success_callback(future.result())
+        else:
+            self.failure_callback(exp)
 
-    def success_callback(self):
+    def success_callback(self, result):
         """
-        Handle success.
+        Handle success, traces a bounded summary of the result.
 
         """
-        print("Finished success called with ", self.task_arguments, " finished with ")
+        if Tracer.enabled:
+            Tracer.record('exit', 'run', self.obj.name, reprlib.repr(result))
 
-    def failure_callback(self):
+    def failure_callback(self, exp):
         """
         Handle exception.
 
         """
-        print("Finished failure called with ", self.task_arguments, " finished with ")
+        if Tracer.enabled:
+            Tracer.record('exception', 'run', self.obj.name, repr(exp))
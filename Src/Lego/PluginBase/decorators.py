@@ -3,92 +3,98 @@ Decorators that wrap plugin functions to add extra functionality.
 
 """
 
+import time
+import logging
 from functools import wraps
+from Lego.Diagnostics import Metrics, Tracer
+from .ExecutorPool import ExecutorPool
 from .TaskRunner import TaskRunner
 
+LOGGER = logging.getLogger(__name__)
+
 # Decorators
-def check_input_configuration(func):
+def _checked(label):
     """
-    Checks input format registered by a plugin.
+    Returns a decorator that times, traces and logs the failures of a plugin function, label
+    names the function in metrics, traces and logs.
 
     """
-    @wraps(func)
-    def decorator(self, *args, **kwargs):
-        """
-        Implements wrapper.
-
+    def check(func):
         """
-        try:
-            print('enter input configuration')
-            ret = func(self, *args, **kwargs)
-            print('leave')
-        except BaseException as exp:
-            print('exception', exp)
-            ret = None
-
-        return ret
-    return decorator
-
-def check_chart_configuration(func):
-    """
-    Checks chart format registered by a plugin.
+        Checks the value a plugin function returns, None if it fails.
 
-    """
-    @wraps(func)
-    def decorator(self, *args, **kwargs):
         """
-        Implements wrapper.
+        @wraps(func)
+        def decorator(self, *args, **kwargs):
+            """
+            Implements wrapper.
+
+            """
+            series = None
+            if Metrics.enabled:
+                series = Metrics.get_series(self.group, self.name, label)
+            started = time.perf_counter()
+            try:
+                if Tracer.enabled:
+                    Tracer.record('enter', label, self.name)
+                ret = func(self, *args, **kwargs)
+                if Tracer.enabled:
+                    Tracer.record('exit', label, self.name)
+                if series is not None:
+                    series.finished(started, failed=False, in_flight=False)
+            except BaseException as exp:
+                if Tracer.enabled:
+                    Tracer.record('exception', label, self.name, repr(exp))
+                if series is not None:
+                    series.finished(started, failed=True, in_flight=False)
+                LOGGER.warning('%s of %s failed: %r', label, self.name, exp)
+                ret = None
+
+            return ret
+        decorator.__decorated__ = True
+        return decorator
+    return check
+
+# Checks input format registered by a plugin.
+check_input_configuration = _checked('input configuration')
+# Checks chart format registered by a plugin.
+check_chart_configuration = _checked('chart configuration')
+# Checks mode operation registered by a plugin.
+check_modes_of_operation = _checked('modes of operation')
 
-        """
-        try:
-            print('enter chart configuration')
-            ret = func(self, *args, **kwargs)
-            print('leave')
-        except BaseException as exp:
-            print('exception', exp)
-            ret = None
-
-        return ret
-    return decorator
-
-def check_modes_of_operation(func):
+def run_async(func):
     """
-    Checks mode operation registered by a plugin.
+    Convert function to run on the shared executor chosen by the plugin.
 
     """
     @wraps(func)
-    def decorator(self, *args, **kwargs):
+    def async_func(self, *args, **kwargs):
         """
-        Implements wrapper.
+        Asynchronous function using executor implementation, returns a Future of the result.
 
         """
-        try:
-            print('enter modes of operation')
-            ret = func(self, *args, **kwargs)
-            print('leave')
-        except BaseException as exp:
-            print('exception', exp)
-            ret = None
+        task = TaskRunner(self, func, *args, **kwargs)
+        return task.submit(ExecutorPool.get_executor(self.executor))
 
-        return ret
-    return decorator
+    async_func.__decorated__ = True
+    return async_func
 
-def run_async(func):
+def run_coroutine(func):
     """
-    Convert function to run in a separate Thread
+    Convert an async function to run on the event loop shared by async plugins.
 
     """
     @wraps(func)
     def async_func(self, *args, **kwargs):
         """
-        Asynchronous function using thread implementation.
+        Schedules the coroutine, returns a Future of the result.
 
         """
-        del args
-        task = TaskRunner(run_function=func, obj=self, kwargs=kwargs)
-        ret = task.start()
-        return ret
+        task = TaskRunner(self, func, *args, **kwargs)
+        return task.submit_coroutine(ExecutorPool.get_event_loop(),
+                                     ExecutorPool.get_group_semaphore)
 
+    async_func.__decorated__ = True
     return async_func
 
 def dont_decorate(func):
@@ -0,0 +1,39 @@
+"""
+Helpers that drive streaming plugins chunk by chunk.
+
+"""
+
+from itertools import chain, islice
+
+def chunked(records, chunk_size):
+    """
+    Splits an iterable of records into lists of at most chunk_size records.
+
+    """
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+async def achunked(records, chunk_size):
+    """
+    Splits an async iterable of records into lists of at most chunk_size records.
+
+    """
+    chunk = []
+    async for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def unchunked(chunks):
+    """
+    Flattens an iterable of chunks back into records.
+
+    """
+    return chain.from_iterable(chunks)
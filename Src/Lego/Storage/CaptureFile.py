@@ -0,0 +1,479 @@
+"""
+Memory mapped capture files of RuntimeMonitorParams records, written online and replayed
+offline.
+
+"""
+import os
+import mmap
+import json
+import time
+import bisect
+import struct
+from collections.abc import Sequence
+
+from Lego.Datatypes import RuntimeMonitorParams
+
+PAGE_FORMAT = '@QQd'
+PAGE_HEADER_SIZE = struct.calcsize(PAGE_FORMAT)
+
+class _CaptureHeader:
+    """
+    Implements the header at the start of a capture file.
+
+    The header holds the page size, the record size, the number of pages and records written so
+    far and the size of the layout stored after it as JSON. Pages start after the layout, at a
+    multiple of the page size. Each page starts with the number of records it holds, the
+    sequence number of its first record and the time that record was written, these page
+    headers form a sparse index of the capture.
+
+    """
+    MAGIC = b'LEGOCAP1'
+    FORMAT = '@8sQQQQQ'
+
+    def __init__(self, page_size=0, record_size=0, size_of_layout=0):
+        """
+        Initializes header.
+
+        """
+        self.page_size = page_size
+        self.record_size = record_size
+        self.number_of_pages = 0
+        self.number_of_records = 0
+        self.size_of_layout = size_of_layout
+
+    def get_bytes(self):
+        """
+        Converts this class into byte representation.
+
+        """
+        return struct.pack(self.FORMAT, self.MAGIC, self.page_size, self.record_size,
+                           self.number_of_pages, self.number_of_records, self.size_of_layout)
+
+    def from_bytes(self, sbyte):
+        """
+        Loads this object from byte representation.
+
+        """
+        (magic, self.page_size, self.record_size, self.number_of_pages, self.number_of_records,
+         self.size_of_layout) = struct.unpack(self.FORMAT, sbyte)
+        if magic != self.MAGIC:
+            raise ValueError('Not a capture file')
+
+    def size_of_meta(self):
+        """
+        Returns size of the header without the layout.
+
+        """
+        return struct.calcsize(self.FORMAT)
+
+    def start_of_pages(self):
+        """
+        Returns offset of the first page.
+
+        """
+        size = self.size_of_meta() + self.size_of_layout
+        return -(-size // self.page_size) * self.page_size
+
+    def get_records_per_page(self):
+        """
+        Returns the number of records that fit in a page.
+
+        """
+        return (self.page_size - PAGE_HEADER_SIZE) // self.record_size
+
+    def __repr__(self):
+        return (str(self.number_of_records) + ' records of size ' + str(self.record_size) +
+                ' in ' + str(self.number_of_pages) + ' pages of ' + str(self.page_size) +
+                ' bytes')
+
+class CaptureRecords(Sequence):
+    """
+    Lazy sequence of records of a capture file backed by memoryview slices of the mapping, no
+    record is copied out of the file.
+
+    """
+    def __init__(self, buffer, size_of_objects, runs):
+        """
+        Describes the records of runs, a list of (offset, count) of consecutive records.
+
+        """
+        self.buffer = buffer
+        self.size_of_objects = size_of_objects
+        self.runs = runs
+        self.starts = []
+        count = 0
+        for _, run_count in runs:
+            self.starts.append(count)
+            count += run_count
+        self.count = count
+
+    def get_offset(self, index):
+        """
+        Returns the offset of record at index within the buffer.
+
+        """
+        run = bisect.bisect_right(self.starts, index) - 1
+        return self.runs[run][0] + (index - self.starts[run]) * self.size_of_objects
+
+    def get_chunks(self):
+        """
+        Returns (buffer, offset, count, stride) for each run of records, one per page.
+
+        """
+        return [(self.buffer, offset, count, self.size_of_objects) for offset, count in self.runs]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            runs = []
+            for (offset, count), first in zip(self.runs, self.starts):
+                low = max(start - first, 0)
+                high = min(stop - first, count)
+                if low < high:
+                    runs.append((offset + low * self.size_of_objects, high - low))
+            return CaptureRecords(self.buffer, self.size_of_objects, runs)
+        if index < 0:
+            index += self.count
+        if index < 0 or index >= self.count:
+            raise IndexError('Capture record index out of range')
+        offset = self.get_offset(index)
+        return self.buffer[offset:offset + self.size_of_objects]
+
+    def __repr__(self):
+        return (str(self.count) + ' records each of size ' + str(self.size_of_objects) + ' in ' +
+                str(len(self.runs)) + ' pages')
+
+class CaptureFile:
+    """
+    File of fixed size records of one RuntimeMonitorParams layout, the layout is stored in the
+    file so any process can replay it.
+
+    Records are appended through a writable mapping that grows GROWTH_PAGES pages at a time and
+    read through a read only mapping, so captures larger than memory can be sliced and decoded
+    in bulk. Records keep the sequence numbers they were appended with, a page is started
+    whenever the sequence does not follow, for instance after a ring overrun. Sequence numbers
+    and page times must not decrease.
+
+    """
+    DEFAULT_PAGE_SIZE = 65536
+    GROWTH_PAGES = 16
+
+    def __init__(self, path, monitor=None, mode='r', page_size=DEFAULT_PAGE_SIZE):
+        """
+        Opens a capture file, mode is 'r' to replay it, 'w' to create it or 'a' to append to
+        it. Creating a file needs the monitor layout of its records, otherwise the layout is read
+        from the file.
+
+        """
+        self.path = path
+        self.monitor = monitor
+        self.writable = mode in ('w', 'a')
+        self.header = _CaptureHeader()
+        self.mapping = None
+        self.size = 0
+        self.page_starts = []
+        self.page_counts = []
+        self.page_sequences = []
+        self.page_times = []
+        if mode == 'w' or (mode == 'a' and not os.path.exists(path)):
+            if monitor is None:
+                raise ValueError('Creating a capture file needs a monitor layout')
+            self._create(page_size)
+        elif mode in ('r', 'a'):
+            self._open()
+        else:
+            raise ValueError('Unknown capture file mode ' + str(mode))
+
+    def _map(self, size=None):
+        """
+        Maps the whole file, extended to size bytes first if it is smaller.
+
+        """
+        fd = os.open(self.path, os.O_RDWR if self.writable else os.O_RDONLY)
+        try:
+            if size is not None and size > os.fstat(fd).st_size:
+                os.ftruncate(fd, size)
+            self.size = os.fstat(fd).st_size
+            access = mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ
+            self.mapping = mmap.mmap(fd, self.size, access=access)
+        finally:
+            os.close(fd)
+
+    def _create(self, page_size):
+        layout = json.dumps(self.monitor.get_layout()).encode('utf-8')
+        record_size = self.monitor.get_size()
+        page_size = max(page_size, PAGE_HEADER_SIZE + record_size)
+        self.header = _CaptureHeader(-(-page_size // 8) * 8, record_size, len(layout))
+        with open(self.path, 'wb'):
+            pass
+        self._map(self.header.start_of_pages())
+        offset = self.header.size_of_meta()
+        self.mapping[offset:offset + len(layout)] = layout
+        self._publish_header()
+
+    def _open(self):
+        self._map()
+        self.header.from_bytes(self.mapping[0:self.header.size_of_meta()])
+        offset = self.header.size_of_meta()
+        layout = json.loads(bytes(self.mapping[offset:offset + self.header.size_of_layout]))
+        stored = RuntimeMonitorParams.from_layout(layout)
+        if self.monitor is not None and self.monitor.type_def != stored.type_def:
+            raise ValueError('Capture file layout ' + stored.type_def + ' does not match ' +
+                             self.monitor.type_def)
+        if stored.get_size() != self.header.record_size:
+            raise ValueError('Capture file record size does not match its layout')
+        self.monitor = self.monitor or stored
+        self._load_index()
+
+    def _page_offset(self, page):
+        return self.header.start_of_pages() + page * self.header.page_size
+
+    def _load_index(self):
+        """
+        Reads the page headers added since the previous load, the last page known may have
+        received records since.
+
+        """
+        self.header.from_bytes(self.mapping[0:self.header.size_of_meta()])
+        if self._page_offset(self.header.number_of_pages) > self.size:
+            self._map()
+        first = max(len(self.page_counts) - 1, 0)
+        for index in (self.page_starts, self.page_counts, self.page_sequences, self.page_times):
+            del index[first:]
+        for page in range(first, self.header.number_of_pages):
+            count, sequence, first_time = struct.unpack_from(PAGE_FORMAT, self.mapping,
+                                                             self._page_offset(page))
+            start = self.page_starts[-1] + self.page_counts[-1] if self.page_counts else 0
+            self.page_starts.append(start)
+            self.page_counts.append(count)
+            self.page_sequences.append(sequence)
+            self.page_times.append(first_time)
+
+    def refresh(self):
+        """
+        Picks up the records appended by a writer since the file was opened.
+
+        """
+        self._load_index()
+
+    def _publish_header(self):
+        self.mapping[0:self.header.size_of_meta()] = self.header.get_bytes()
+
+    def _publish(self, page):
+        """
+        Writes the header of a page and the file header, records become visible to readers.
+
+        """
+        struct.pack_into(PAGE_FORMAT, self.mapping, self._page_offset(page),
+                         self.page_counts[page], self.page_sequences[page], self.page_times[page])
+        self.header.number_of_pages = len(self.page_counts)
+        self.header.number_of_records = self.page_starts[-1] + self.page_counts[-1]
+        self._publish_header()
+
+    def _reserve(self, sequence, timestamp):
+        """
+        Returns the page and offset of the next record, starting a page when the last one is
+        full or sequence does not follow its records.
+
+        """
+        page = len(self.page_counts) - 1
+        if page >= 0:
+            next_sequence = self.page_sequences[page] + self.page_counts[page]
+            if sequence is None:
+                sequence = next_sequence
+            if self.page_counts[page] == 0:
+                # Nothing was written to it, restart it from this record.
+                self.page_sequences[page] = sequence
+                self.page_times[page] = time.time() if timestamp is None else timestamp
+            elif (self.page_counts[page] == self.header.get_records_per_page() or
+                  sequence != next_sequence):
+                self._publish(page)
+                page = -1
+        if page < 0 or page == len(self.page_counts):
+            page = len(self.page_counts)
+            required = self._page_offset(page + 1)
+            if required > self.size:
+                self._map(max(required, self.size + self.GROWTH_PAGES * self.header.page_size))
+            self.page_starts.append(self.page_starts[-1] + self.page_counts[-1]
+                                    if self.page_counts else 0)
+            self.page_counts.append(0)
+            self.page_sequences.append(0 if sequence is None else sequence)
+            self.page_times.append(time.time() if timestamp is None else timestamp)
+        return page, (self._page_offset(page) + PAGE_HEADER_SIZE +
+                      self.page_counts[page] * self.header.record_size)
+
+    def _check_record(self, record):
+        if len(record) != self.header.record_size:
+            raise ValueError('Record of size ' + str(len(record)) + ' in a capture of size ' +
+                             str(self.header.record_size))
+
+    def append_record(self, record, sequence=None, timestamp=None):
+        """
+        Appends a serialized record, sequence defaults to the one following the previous
+        record. The timestamp is kept when the record starts a page.
+
+        """
+        self._check_record(record)
+        page, offset = self._reserve(sequence, timestamp)
+        self.mapping[offset:offset + self.header.record_size] = record
+        self.page_counts[page] += 1
+        self._publish(page)
+
+    def append_object(self, obj, sequence=None, timestamp=None):
+        """
+        Serializes an object straight into the file.
+
+        """
+        page, offset = self._reserve(sequence, timestamp)
+        self.monitor.serialize_into(self.mapping, offset, obj)
+        self.page_counts[page] += 1
+        self._publish(page)
+
+    def append_many(self, records, sequence=None, timestamp=None):
+        """
+        Appends serialized records with consecutive sequence numbers starting at sequence, the
+        headers are published once per page. Returns the number of records appended.
+
+        """
+        count = 0
+        page = None
+        record_size = self.header.record_size
+        for record in records:
+            self._check_record(record)
+            page, offset = self._reserve(None if sequence is None else sequence + count,
+                                         timestamp)
+            self.mapping[offset:offset + record_size] = record
+            self.page_counts[page] += 1
+            count += 1
+        if page is not None:
+            self._publish(page)
+        return count
+
+    def spill(self, ring):
+        """
+        Moves the records of a ShmemRing reader to the file, keeping their ring sequence numbers
+        so overruns show up as gaps. Returns the number of records moved.
+
+        """
+        views = ring.read_views(release=False)
+        try:
+            return self.append_many(views, sequence=ring.tail - len(views))
+        finally:
+            del views
+            ring.release()
+
+    def __len__(self):
+        return self.header.number_of_records
+
+    def read_record(self, position):
+        """
+        Reads record at position without copying.
+
+        """
+        if position < 0 or position >= len(self):
+            raise IndexError('Capture record index out of range')
+        page = bisect.bisect_right(self.page_starts, position) - 1
+        offset = (self._page_offset(page) + PAGE_HEADER_SIZE +
+                  (position - self.page_starts[page]) * self.header.record_size)
+        return memoryview(self.mapping)[offset:offset + self.header.record_size]
+
+    def read_views(self, start=0, stop=None):
+        """
+        Reads the records from start to stop without copying them.
+
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        runs = []
+        page = max(bisect.bisect_right(self.page_starts, start) - 1, 0)
+        while start < stop:
+            first = self.page_starts[page]
+            count = min(stop, first + self.page_counts[page]) - start
+            if count > 0:
+                runs.append((self._page_offset(page) + PAGE_HEADER_SIZE +
+                             (start - first) * self.header.record_size, count))
+                start += count
+            page += 1
+        return CaptureRecords(memoryview(self.mapping), self.header.record_size, runs)
+
+    def read(self, start=0, stop=None):
+        """
+        Returns the records from start to stop decoded, a page at a time.
+
+        """
+        objs = []
+        record_size = self.header.record_size
+        for buffer, offset, count, _ in self.read_views(start, stop).get_chunks():
+            objs.extend(self.monitor.iter_deserialize(buffer[offset:offset + count * record_size]))
+        return objs
+
+    def read_array(self, start=0, stop=None):
+        """
+        Returns the records from start to stop as a NumPy structured array.
+
+        """
+        return self.monitor.deserialize_many(self.read_views(start, stop))
+
+    def get_sequence(self, position):
+        """
+        Returns the sequence number of record at position.
+
+        """
+        if position < 0 or position >= len(self):
+            raise IndexError('Capture record index out of range')
+        page = bisect.bisect_right(self.page_starts, position) - 1
+        return self.page_sequences[page] + position - self.page_starts[page]
+
+    def find_sequence(self, sequence):
+        """
+        Returns the position of the record with a sequence number, LookupError if it was not
+        captured.
+
+        """
+        page = bisect.bisect_right(self.page_sequences, sequence) - 1
+        if page < 0 or sequence >= self.page_sequences[page] + self.page_counts[page]:
+            raise LookupError('Sequence ' + str(sequence) + ' is not in the capture')
+        return self.page_starts[page] + sequence - self.page_sequences[page]
+
+    def find_time(self, timestamp):
+        """
+        Returns the position replays starting at timestamp begin at, the first record of the
+        last page started at or before it. The index is sparse, records of that page may be
+        older.
+
+        """
+        page = bisect.bisect_right(self.page_times, timestamp) - 1
+        return self.page_starts[page] if page >= 0 else 0
+
+    def flush(self):
+        """
+        Writes the mapped pages back to the file.
+
+        """
+        self.mapping.flush()
+
+    def close(self):
+        """
+        Closes the mapping, a writer truncates the file after its last page. Views handed out
+        must be released first.
+
+        """
+        end = self._page_offset(len(self.page_counts))
+        if self.writable:
+            self.mapping.flush()
+        self.mapping.close()
+        if self.writable:
+            os.truncate(self.path, end)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return 'CaptureFile(' + self.path + ', ' + repr(self.header) + ')'
@@ -0,0 +1,6 @@
+"""
+Module export for on disk storage of monitor records.
+
+"""
+
+from Lego.Storage.CaptureFile import CaptureFile, CaptureRecords
@@ -0,0 +1,36 @@
+"""
+Benchmarks for the hot paths of the library, run them from the Src directory.
+
+    python -m benchmarks --output results.json --compare previous.json
+
+"""
+import timeit
+
+def measure(func, number):
+    """
+    Returns operations per second, best of three runs.
+
+    """
+    return number / min(timeit.repeat(func, number=number, repeat=3))
+
+def result(benchmark, ops_per_second, **params):
+    """
+    Returns a machine readable result, params tell apart the results of one benchmark.
+
+    """
+    return {
+        'benchmark': benchmark,
+        'params': params,
+        'ops_per_second': ops_per_second,
+        'seconds_per_op': 1.0 / ops_per_second if ops_per_second else None,
+    }
+
+def percentiles(samples, fractions=(0.5, 0.9, 0.99)):
+    """
+    Returns the given percentiles of a list of samples, keyed p50, p90 and so on.
+
+    """
+    samples = sorted(samples)
+    return {'p' + str(int(fraction * 100)): samples[min(int(fraction * len(samples)),
+                                                        len(samples) - 1)]
+            for fraction in fractions}
@@ -0,0 +1,79 @@
+"""
+Runs the whole suite and writes the results as JSON, optionally compared with a previous run.
+
+    python -m benchmarks [--quick] [--output results.json] [--compare previous.json]
+
+Exits with status 1 when a result is slower than the previous run by more than the tolerance.
+
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+
+from benchmarks import codec, ipc, plugins
+
+def run_all(quick=False):
+    """
+    Returns the results of every benchmark with the environment they were measured in.
+
+    """
+    results = codec.run(10000 if quick else 100000) + ipc.run(quick) + plugins.run(quick)
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'quick': quick,
+        'results': results,
+    }
+
+def compare(current, previous, tolerance):
+    """
+    Returns the results that got slower than the previous run by more than tolerance, as
+    (result, previous operations per second) pairs.
+
+    """
+    def key(entry):
+        return entry['benchmark'], json.dumps(entry['params'], sort_keys=True)
+    before = {key(entry): entry['ops_per_second'] for entry in previous['results']}
+    regressions = []
+    for entry in current['results']:
+        baseline = before.get(key(entry))
+        if baseline and entry['ops_per_second'] < baseline * (1 - tolerance):
+            regressions.append((entry, baseline))
+    return regressions
+
+def main(argv=None):
+    """
+    Command line entry point.
+
+    """
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.strip())
+    parser.add_argument('--quick', action='store_true', help='measure fewer sizes and calls')
+    parser.add_argument('--output', help='file to write the JSON results to, stdout if unset')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='slowdown tolerated before a result is reported, 0.2 is 20%%')
+    args = parser.parse_args(argv)
+
+    current = run_all(args.quick)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(current, output, indent=2)
+    else:
+        json.dump(current, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    if not args.compare:
+        return 0
+    with open(args.compare) as previous_file:
+        regressions = compare(current, json.load(previous_file), args.tolerance)
+    for entry, baseline in regressions:
+        sys.stderr.write('%s %s: %.0f ops/s, was %.0f ops/s\n' %
+                         (entry['benchmark'], json.dumps(entry['params'], sort_keys=True),
+                          entry['ops_per_second'], baseline))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Compares the compiled RuntimeMonitorParams codec with the original per call struct path.
+
+    python -m benchmarks.codec
+
+"""
+import array
+import struct
+from collections import namedtuple
+
+from Lego.Datatypes.RuntimeMonitorParams import RuntimeMonitorParams
+from benchmarks import measure, result
+
+def build_monitor():
+    """
+    Builds the layout used by main.py.
+
+    """
+    monitor = RuntimeMonitorParams()
+    monitor.add_string_field('name', 20)
+    monitor.add_unsigned_integer_field('score')
+    monitor.add_signed_integer_field('credit')
+    monitor.add_string_field('city', 20)
+    return monitor
+
+def baseline_serialize(monitor, obj):
+    """
+    Serialization as it was done before the codec, format parsed on every call.
+
+    """
+    obj_as_list = list(obj)
+    for spos in monitor.string_positions:
+        obj_as_list[spos] = obj_as_list[spos].encode()
+    return struct.pack(monitor.type_def, *obj_as_list)
+
+def baseline_deserialize(monitor, deserializer, obj):
+    """
+    Deserialization as it was done before the codec, two namedtuples and a dict per object.
+
+    """
+    obj = deserializer._make(struct.unpack(monitor.type_def, obj))
+    obj_as_dict = obj._asdict()
+    for spos in monitor.string_positions:
+        string_value = getattr(obj, monitor.var_names[spos]).decode('utf-8')
+        obj_as_dict[monitor.var_names[spos]] = string_value
+    return deserializer(*obj_as_dict.values())
+
+def build_layouts():
+    """
+    Builds the layouts the suite measures with one value of each, by layout name.
+
+    """
+    layouts = {'main': (build_monitor(), ('Kush', 22, -1, 'hyd'))}
+    monitor = RuntimeMonitorParams()
+    for position in range(8):
+        monitor.add_unsigned_integer_field('counter' + str(position))
+    layouts['integers'] = (monitor, tuple(range(8)))
+    monitor = RuntimeMonitorParams()
+    for position in range(4):
+        monitor.add_string_field('text' + str(position), 64)
+    layouts['strings'] = (monitor, ('alpha', 'beta', 'gamma', 'delta'))
+    monitor = RuntimeMonitorParams()
+    values = []
+    for position in range(32):
+        if position % 4 == 0:
+            monitor.add_string_field('field' + str(position), 8)
+            values.append('v' + str(position))
+        else:
+            monitor.add_signed_integer_field('field' + str(position))
+            values.append(-position)
+    layouts['wide'] = (monitor, tuple(values))
+    monitor = RuntimeMonitorParams()
+    monitor.add_unsigned_integer_field('sequence')
+    monitor.add_array_field('samples', 'float', 256)
+    layouts['array'] = (monitor, (1, array.array('f', range(256))))
+    return layouts
+
+def run(number=100000):
+    """
+    Returns operations per second of the codec paths for each layout.
+
+    """
+    results = []
+    for name, (monitor, value) in build_layouts().items():
+        packed = monitor.serialize(value)
+        buffer = bytearray(packed * 1000)
+        params = {'layout': name, 'record_size': monitor.get_size()}
+        results.extend([
+            result('codec.serialize', measure(lambda: monitor.serialize(value), number), **params),
+            result('codec.serialize_into',
+                   measure(lambda: monitor.serialize_into(buffer, 0, value), number), **params),
+            result('codec.deserialize', measure(lambda: monitor.deserialize(packed), number),
+                   **params),
+            result('codec.iter_deserialize',
+                   1000 * measure(lambda: list(monitor.iter_deserialize(buffer)), number // 1000),
+                   **params),
+        ])
+    return results
+
+def main(number=100000):
+    """
+    Prints operations per second of the baseline and the compiled paths.
+
+    """
+    monitor = build_monitor()
+    deserializer = namedtuple('RuntimeMonitorParamsDeserialized', field_names=monitor.var_names)
+    value = ('Kush', 22, -1, 'hyd')
+    packed = monitor.serialize(value)
+    buffer = bytearray(packed * 1000)
+
+    results = [
+        ('serialize', measure(lambda: baseline_serialize(monitor, value), number),
+         measure(lambda: monitor.serialize(value), number)),
+        ('serialize_into', measure(lambda: baseline_serialize(monitor, value), number),
+         measure(lambda: monitor.serialize_into(buffer, 0, value), number)),
+        ('deserialize', measure(lambda: baseline_deserialize(monitor, deserializer, packed), number),
+         measure(lambda: monitor.deserialize(packed), number)),
+        ('iter_deserialize', measure(lambda: baseline_deserialize(monitor, deserializer, packed),
+                                     number),
+         1000 * measure(lambda: list(monitor.iter_deserialize(buffer)), number // 1000)),
+    ]
+    for name, baseline, compiled in results:
+        print('%-18s baseline %12.0f ops/s  compiled %12.0f ops/s  x%.1f' %
+              (name, baseline, compiled, compiled / baseline))
+
+if __name__ == '__main__':
+    main()
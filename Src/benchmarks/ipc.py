@@ -0,0 +1,126 @@
+"""
+Measures Shmem append and read throughput and the latency of records between processes.
+
+    python -m benchmarks.ipc
+
+"""
+import os
+import struct
+import time
+import itertools
+import multiprocessing
+
+from Lego.Ipc import Shmem, ShmemRing
+from benchmarks import percentiles, result
+
+RECORD_SIZES = (16, 64, 256, 1024)
+RECORD_COUNTS = (100, 1000, 10000)
+TASKIDS = itertools.count(os.getpid() * 1000)
+STAMP = struct.Struct('@d')
+
+def _unlink(shmem):
+    shmem.close()
+    Shmem.unlink(shmem.taskid)
+
+def _time_segment(size, count, append, read):
+    """
+    Appends count records of size bytes to a new segment and reads them back, returns the
+    seconds spent appending and reading.
+
+    """
+    record = bytes(size)
+    writer = Shmem(next(TASKIDS), size=Shmem.size_for(size, count))
+    reader = Shmem(writer.taskid, child=False)
+    try:
+        started = time.perf_counter()
+        append(writer, record, count)
+        appended = time.perf_counter()
+        records = read(reader)
+        read_time = time.perf_counter() - appended
+        assert len(records) == count
+        del records
+        return appended - started, read_time
+    finally:
+        _unlink(reader)
+        _unlink(writer)
+
+def _append_each(writer, record, count):
+    for _ in range(count):
+        writer.append_shmem(record)
+
+def _append_many(writer, record, count):
+    writer.append_many([record] * count)
+
+def run_shmem(sizes=RECORD_SIZES, counts=RECORD_COUNTS, repeat=3):
+    """
+    Returns records per second appended one at a time and in a batch, and read with copies
+    and as views, for every record size and count.
+
+    """
+    results = []
+    for size, count in itertools.product(sizes, counts):
+        params = {'record_size': size, 'count': count}
+        for append_name, append in (('append_shmem', _append_each),
+                                    ('append_many', _append_many)):
+            timings = [_time_segment(size, count, append, Shmem.read_shmem)
+                       for _ in range(repeat)]
+            results.append(result('shmem.' + append_name, count / min(t[0] for t in timings),
+                                  **params))
+        for read_name, read in (('read_shmem', Shmem.read_shmem),
+                                ('read_views', Shmem.read_views)):
+            timings = [_time_segment(size, count, _append_many, read) for _ in range(repeat)]
+            results.append(result('shmem.' + read_name, count / min(t[1] for t in timings),
+                                  **params))
+    return results
+
+def _produce(taskid, count, interval):
+    """
+    Writes count timestamps to a ring, one every interval seconds.
+
+    """
+    ring = ShmemRing(taskid, STAMP.size, overwrite=False, capacity=count, resume=True)
+    for _ in range(count):
+        ring.append_shmem(STAMP.pack(time.perf_counter()))
+        deadline = time.perf_counter() + interval
+        while time.perf_counter() < deadline:
+            pass
+    ring.close()
+
+def run_latency(count=2000, interval=0.0001):
+    """
+    Returns the latency of timestamps sent by a forked producer process to a reader waiting
+    on the ring, in seconds. The clock of perf_counter is shared between processes on Linux.
+
+    """
+    taskid = next(TASKIDS)
+    ShmemRing(taskid, STAMP.size, capacity=count).close()
+    reader = ShmemRing(taskid, STAMP.size, child=False)
+    context = multiprocessing.get_context('fork')
+    producer = context.Process(target=_produce, args=(taskid, count, interval), daemon=True)
+    samples = []
+    producer.start()
+    try:
+        while len(samples) < count and (producer.is_alive() or reader._has_new_data()):
+            reader.wait_for_data(0.1)
+            received = time.perf_counter()
+            samples.extend(received - STAMP.unpack(record)[0] for record in reader.read_shmem())
+    finally:
+        producer.join()
+        _unlink(reader)
+    entry = result('ipc.cross_process_latency', len(samples) / sum(samples), count=count,
+                   interval=interval)
+    entry.update(('latency_' + key, value) for key, value in percentiles(samples).items())
+    return entry
+
+def run(quick=False):
+    """
+    Returns every IPC result, quick runs measure fewer sizes and counts.
+
+    """
+    if quick:
+        return run_shmem(sizes=(64, 1024), counts=(1000,), repeat=1) + [run_latency(500)]
+    return run_shmem() + [run_latency()]
+
+if __name__ == '__main__':
+    for entry in run():
+        print(entry)
@@ -0,0 +1,110 @@
+"""
+Measures the cost of plugin input configurations and of dispatching runs to the executors.
+
+    python -m benchmarks.plugins
+
+"""
+import asyncio
+import inspect
+import time
+
+from Lego.PluginBase.ExecutorPool import ExecutorPool
+from Lego.PluginBase.PluginBase import PluginBase
+from benchmarks import measure, result
+
+class BenchmarkPlugin(PluginBase):
+    """
+    Plugin with a trivial run, so that only the dispatch is measured.
+
+    """
+    def __init__(self, name, group):
+        """
+        Declares a few input parameters.
+
+        """
+        params = self.input_params
+        params.add_string_field('path', params.get_string_length_validation(1, 255),
+                                required=True)
+        params.add_integer_field('count', params.get_integer_range_validation(0, 1000))
+        params.add_string_field('mode', params.get_string_one_of_validate(['online', 'offline']))
+
+    def get_chart_configuration(self):
+        return None
+
+    def get_modes_of_operation(self):
+        return ['online', 'offline']
+
+    def run(self, value=0):
+        return value
+
+class BenchmarkAsyncPlugin(BenchmarkPlugin):
+    """
+    Plugin with a trivial async run.
+
+    """
+    async def run(self, value=0):
+        return value
+
+def run_input_configuration(number=1000):
+    """
+    Returns input configurations per second, cached and generated again on every call.
+
+    """
+    plugin = BenchmarkPlugin('InputConfiguration', 'benchmarks')
+
+    def uncached():
+        plugin.input_configuration = None
+        plugin.input_params.schemas.clear()
+        plugin.get_input_configuration()
+
+    return [
+        result('plugin.get_input_configuration', measure(plugin.get_input_configuration, number),
+               cached=True),
+        result('plugin.get_input_configuration', measure(uncached, number // 10), cached=False),
+    ]
+
+def _dispatch(plugin, number):
+    started = time.perf_counter()
+    futures = [plugin.run(value) for value in range(number)]
+    for future in futures:
+        future.result()
+    return number / (time.perf_counter() - started)
+
+def run_dispatch(number=10000):
+    """
+    Returns runs per second called directly and dispatched through run_async to each executor,
+    and through the shared event loop.
+
+    """
+    plugin = BenchmarkPlugin('Dispatch', 'benchmarks')
+    direct = inspect.unwrap(type(plugin).run)
+    results = [result('plugin.run_direct', measure(lambda: direct(plugin, 1), number))]
+    for kind, count in (('thread', number), ('process', number // 10)):
+        plugin.executor = kind
+        _dispatch(plugin, min(count, 100))
+        results.append(result('plugin.run_async', max(_dispatch(plugin, count)
+                                                      for _ in range(3)), executor=kind))
+    async_plugin = BenchmarkAsyncPlugin('AsyncDispatch', 'benchmarks')
+    _dispatch(async_plugin, 100)
+    results.append(result('plugin.run_async', max(_dispatch(async_plugin, number)
+                                                  for _ in range(3)), executor='event_loop'))
+    results.append(result('plugin.arun', measure(lambda: asyncio.run(async_plugin.arun(1)),
+                                                 number // 10)))
+    return results
+
+def run(quick=False):
+    """
+    Returns every plugin result, quick runs measure fewer calls.
+
+    """
+    scale = 10 if quick else 1
+    try:
+        return run_input_configuration(1000 // scale) + run_dispatch(10000 // scale)
+    finally:
+        for plugin in list(PluginBase.get_plugins_group('benchmarks') or ()):
+            PluginBase.unregister_plugin(plugin)
+        ExecutorPool.shutdown()
+
+if __name__ == '__main__':
+    for entry in run():
+        print(entry)
@@ -4,3 +4,6 @@ Expose imports from the library as api.
 """
 from Lego.PluginBase.PluginBase import PluginBase
 from Lego.PluginBase.TaskRunner import TaskRunner
+from Lego.PluginBase.ExecutorPool import ExecutorPool
+from Lego.PluginBase.ProcessWorker import ProcessWorker
+from Lego.PluginBase.PluginRegistry import PluginRegistry
@@ -36,9 +36,9 @@ def main():
     writer_ipc.append_shmem(obj)
     writer_ipc.append_shmem(obj)
 
-    objs = reader_ipc.read_shmem()
+    objs = reader_ipc.read_views()
     for obj in objs:
-        after = monitor.deserialize(obj[:48])
+        after = monitor.deserialize(obj)
         print(after.name)
         print(after.score)
         print(after.credit)
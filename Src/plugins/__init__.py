@@ -1,16 +1,76 @@
 import os
+import ast
 import imp
+import json
 from pathtools import path
+from Lego import PluginBase
 
+LOADED_MODULES = set()
 
 def load_module(module):
     if not module.endswith('.py') or module.endswith('__init__.py'):
         return
+    if module in LOADED_MODULES:
+        return
+    LOADED_MODULES.add(module)
     imp.load_source(name=os.path.basename(module), pathname=module)
     # return imp.load_module(__file__, *module["info"])
 
+def declared_plugins(module):
+    """
+    Finds the plugins a module creates at import time, Plugin(name="...", group="..."), without
+    importing it. Returns None if a declaration cannot be read statically.
+
+    """
+    with open(module) as source:
+        tree = ast.parse(source.read(), filename=module)
+    plugins = []
+    for node in tree.body:
+        if not isinstance(node, (ast.Assign, ast.Expr)) or not isinstance(node.value, ast.Call):
+            continue
+        keywords = {keyword.arg: keyword.value for keyword in node.value.keywords}
+        if 'name' not in keywords and 'group' not in keywords:
+            continue
+        values = [keywords.get(key) for key in ('name', 'group')]
+        if not all(isinstance(value, ast.Constant) for value in values):
+            return None
+        plugins.append([values[0].value, values[1].value])
+    return plugins or None
+
+def load_index(modules, index_path):
+    """
+    Returns the plugins declared by each module, rescanning only modules whose modification time
+    changed since the index was saved.
+
+    """
+    try:
+        with open(index_path) as index_file:
+            cached = json.load(index_file)
+    except (OSError, ValueError):
+        cached = {}
+    index = {}
+    for module in modules:
+        mtime = os.stat(module).st_mtime
+        entry = cached.get(module)
+        if entry is None or entry['mtime'] != mtime:
+            entry = {'mtime': mtime, 'plugins': declared_plugins(module)}
+        index[module] = entry
+    if index != cached:
+        try:
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            with open(index_path, 'w') as index_file:
+                json.dump(index, index_file)
+        except OSError:
+            pass
+    return index
+
 PLUGIN_PATH = os.path.dirname(__file__)
 print("MAPPING", PLUGIN_PATH)
-for module in path.list_files(PLUGIN_PATH, recursive=False):
-    load_module(module)
-# , action=(lambda module: load_module(module)))
\ No newline at end of file
+MODULES = [module for module in path.list_files(PLUGIN_PATH, recursive=False)
+           if module.endswith('.py') and not module.endswith('__init__.py')]
+INDEX = load_index(MODULES, os.path.join(PLUGIN_PATH, '__pycache__', 'plugin_index.json'))
+# Modules are imported on first use of one of their groups, modules whose plugins could not be
+# indexed are imported on first use of any group.
+for module, entry in INDEX.items():
+    for name, group in entry['plugins'] or [[None, None]]:
+        PluginBase.add_plugin_source(group, name, lambda module=module: load_module(module))
@@ -0,0 +1,128 @@
+"""
+Tests of CaptureFile writes, replays and its sparse index.
+
+    python -m unittest discover tests
+
+"""
+import os
+import itertools
+import tempfile
+import unittest
+
+from Lego.Datatypes import RuntimeMonitorParams
+from Lego.Ipc import ShmemRing
+from Lego.Storage import CaptureFile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TASKIDS = itertools.count(os.getpid() * 1000 + 900)
+
+def make_monitor():
+    monitor = RuntimeMonitorParams()
+    monitor.add_unsigned_integer_field('value')
+    monitor.add_double_field('ratio')
+    return monitor
+
+class CaptureFileTest(unittest.TestCase):
+    """
+    Captures of pages holding a few records each.
+
+    """
+    PAGE_SIZE = 256
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'capture')
+        self.monitor = make_monitor()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create(self):
+        return CaptureFile(self.path, self.monitor, 'w', page_size=self.PAGE_SIZE)
+
+    def test_replay_reads_the_layout_from_the_file(self):
+        with self.create() as capture:
+            for value in range(40):
+                capture.append_object((value, value / 2))
+            self.assertGreater(capture.header.number_of_pages, 1)
+        with CaptureFile(self.path) as capture:
+            self.assertEqual(len(capture), 40)
+            self.assertEqual(capture.read(), [(value, value / 2) for value in range(40)])
+            self.assertEqual(capture.read(18, 22), [(value, value / 2) for value in range(18, 22)])
+            self.assertEqual(capture.monitor.deserialize(capture.read_record(39)), (39, 19.5))
+            views = capture.read_views(5, 35)
+            self.assertEqual(len(views), 30)
+            self.assertGreater(len(views.get_chunks()), 1)
+            del views
+
+    def test_sequence_gaps_start_a_page(self):
+        with self.create() as capture:
+            capture.append_many([self.monitor.serialize((value, 0.0)) for value in range(3)],
+                                sequence=10)
+            capture.append_record(self.monitor.serialize((3, 0.0)), sequence=20)
+            self.assertEqual([capture.get_sequence(position) for position in range(4)],
+                             [10, 11, 12, 20])
+            self.assertEqual(capture.find_sequence(12), 2)
+            self.assertEqual(capture.find_sequence(20), 3)
+            with self.assertRaises(LookupError):
+                capture.find_sequence(13)
+
+    def test_find_time_returns_the_start_of_a_page(self):
+        with self.create() as capture:
+            capture.append_object((0, 0.0), sequence=0, timestamp=100.0)
+            capture.append_object((1, 0.0), timestamp=150.0)
+            capture.append_object((2, 0.0), sequence=5, timestamp=200.0)
+            self.assertEqual(capture.find_time(50.0), 0)
+            self.assertEqual(capture.find_time(150.0), 0)
+            self.assertEqual(capture.find_time(250.0), 2)
+
+    def test_readers_pick_up_appended_records(self):
+        with self.create() as capture:
+            capture.append_object((0, 0.0))
+        with CaptureFile(self.path, mode='a') as writer, CaptureFile(self.path) as reader:
+            self.assertEqual(len(reader), 1)
+            for value in range(1, 40):
+                writer.append_object((value, 0.0))
+            reader.refresh()
+            self.assertEqual([obj.value for obj in reader.read()], list(range(40)))
+
+    def test_records_of_another_size_are_refused(self):
+        with self.create() as capture:
+            with self.assertRaises(ValueError):
+                capture.append_record(bytes(self.monitor.get_size() + 1))
+        with self.assertRaises(ValueError):
+            CaptureFile(self.path, mode='w')
+
+    def test_spilled_ring_overruns_show_up_as_gaps(self):
+        taskid = next(TASKIDS)
+        writer = ShmemRing(taskid, self.monitor.get_size(), capacity=4)
+        reader = ShmemRing(taskid, self.monitor.get_size(), child=False)
+        try:
+            for value in range(6):
+                writer.append_shmem(self.monitor.serialize((value, 0.0)))
+            with self.create() as capture:
+                self.assertEqual(capture.spill(reader), 4)
+                self.assertEqual([capture.get_sequence(position) for position in range(4)],
+                                 [2, 3, 4, 5])
+                self.assertEqual([obj.value for obj in capture.read()], [2, 3, 4, 5])
+        finally:
+            reader.close()
+            writer.close()
+            ShmemRing.unlink(taskid)
+
+    @unittest.skipIf(numpy is None, 'needs numpy')
+    def test_read_array_spans_pages(self):
+        with self.create() as capture:
+            for value in range(40):
+                capture.append_object((value, value / 2))
+            array = capture.read_array(5, 35)
+            self.assertEqual(list(array['value']), list(range(5, 35)))
+            self.assertEqual(list(array['ratio']), [value / 2 for value in range(5, 35)])
+            del array
+
+if __name__ == '__main__':
+    unittest.main()
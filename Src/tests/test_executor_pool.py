@@ -0,0 +1,98 @@
+"""
+Tests of the shared plugin executors.
+
+    python -m unittest discover tests
+
+"""
+import os
+import threading
+import unittest
+import multiprocessing
+from concurrent.futures import BrokenExecutor, ThreadPoolExecutor
+
+from Lego.PluginBase.ExecutorPool import BoundedExecutor, ExecutorPool
+from Lego.PluginBase.PluginBase import PluginBase
+
+GROUP = 'ExecutorPoolTest'
+
+class ThreadPlugin(PluginBase):
+    """
+    Returns the process it ran in, fails on negative values.
+
+    """
+    def get_chart_configuration(self):
+        return None
+
+    def get_modes_of_operation(self):
+        return ['online']
+
+    def run(self, value=0):
+        if value < 0:
+            raise ValueError('negative value')
+        return value, os.getpid()
+
+class ProcessPlugin(ThreadPlugin):
+    """
+    Runs on the process executor.
+
+    """
+    executor = 'process'
+
+class BoundedExecutorTest(unittest.TestCase):
+    """
+    Producers wait once max_pending tasks are queued or running.
+
+    """
+    def test_submit_waits_for_a_free_slot(self):
+        executor = BoundedExecutor(ThreadPoolExecutor(max_workers=1), 2)
+        gate = threading.Event()
+        try:
+            futures = [executor.submit(gate.wait) for _ in range(2)]
+            submitter = threading.Thread(target=lambda: futures.append(executor.submit(len, '')))
+            submitter.start()
+            submitter.join(0.1)
+            self.assertTrue(submitter.is_alive())
+            gate.set()
+            submitter.join()
+            self.assertEqual([future.result() for future in futures], [True, True, 0])
+        finally:
+            gate.set()
+            executor.shutdown()
+
+class ExecutorPoolTest(unittest.TestCase):
+    """
+    Plugin runs return futures of the shared executors.
+
+    """
+    def setUp(self):
+        self.plugins = [ThreadPlugin('Thread', GROUP), ProcessPlugin('Process', GROUP)]
+
+    def tearDown(self):
+        ExecutorPool.shutdown()
+        for plugin in self.plugins:
+            PluginBase.unregister_plugin(plugin)
+
+    def test_thread_plugins_run_in_this_process(self):
+        plugin = PluginBase.get_plugin(GROUP, 'Thread')
+        self.assertEqual(plugin.run(3).result(), (3, os.getpid()))
+        with self.assertRaises(ValueError):
+            plugin.run(-1).result()
+
+    @unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), 'needs fork')
+    def test_process_plugins_run_in_worker_processes(self):
+        ExecutorPool.configure('process', 2)
+        value, pid = PluginBase.get_plugin(GROUP, 'Process').run(value=4).result()
+        self.assertEqual(value, 4)
+        self.assertNotEqual(pid, os.getpid())
+
+    @unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), 'needs fork')
+    def test_broken_process_executor_is_replaced(self):
+        executor = ExecutorPool.configure('process', 1)
+        with self.assertRaises(BrokenExecutor):
+            executor.submit(os._exit, 1).result()
+        self.assertTrue(executor.broken)
+        self.assertIsNot(ExecutorPool.get_executor('process'), executor)
+        self.assertEqual(PluginBase.get_plugin(GROUP, 'Process').run(5).result()[0], 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+Tests of the cached plugin input configurations.
+
+    python -m unittest discover tests
+
+"""
+import unittest
+
+from Lego.PluginBase.PluginBase import PluginBase
+
+GROUP = 'InputConfigurationTest'
+
+def properties(configuration):
+    definition, = configuration['definitions'].values()
+    return definition['properties']
+
+class ConfiguredPlugin(PluginBase):
+    """
+    Asks for a device id and name.
+
+    """
+    def __init__(self, name, group):
+        """
+        Declares the input parameters.
+
+        """
+        # pylint: disable=W0231
+        self.input_params.add_integer_field('device_id', None, required=True)
+        self.input_params.add_string_field('device_name', None)
+
+    def get_chart_configuration(self):
+        return None
+
+    def get_modes_of_operation(self):
+        return ['online']
+
+    def run(self):
+        return None
+
+class InputConfigurationTest(unittest.TestCase):
+    """
+    Input configurations are built again only when something they depend on changed.
+
+    """
+    def setUp(self):
+        self.plugins = [ConfiguredPlugin('First', GROUP)]
+
+    def tearDown(self):
+        for plugin in self.plugins:
+            PluginBase.unregister_plugin(plugin)
+
+    def test_configuration_follows_the_input_parameters(self):
+        plugin = self.plugins[0]
+        configuration = plugin.get_input_configuration()
+        self.assertEqual(set(properties(configuration)), {'device_id', 'device_name'})
+        self.assertIs(plugin.get_input_configuration(), configuration)
+        plugin.input_params.add_integer_field('limit', None)
+        self.assertIn('limit', properties(plugin.get_input_configuration()))
+
+    def test_configurations_follow_the_registry(self):
+        configurations = PluginBase.get_input_configurations()
+        self.assertEqual(list(configurations[GROUP]), ['First'])
+        self.assertIs(PluginBase.get_input_configurations(), configurations)
+        self.plugins.append(ConfiguredPlugin('Second', GROUP))
+        configurations = PluginBase.get_input_configurations()
+        self.assertEqual(list(configurations[GROUP]), ['First', 'Second'])
+        self.plugins[1].input_params.add_integer_field('limit', None)
+        self.assertIn('limit', properties(PluginBase.get_input_configurations()[GROUP]['Second']))
+        PluginBase.unregister_plugin(self.plugins.pop())
+        self.assertEqual(list(PluginBase.get_input_configurations()[GROUP]), ['First'])
+
+if __name__ == '__main__':
+    unittest.main()
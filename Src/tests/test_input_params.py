@@ -0,0 +1,55 @@
+"""
+Tests of the compiled InputParams validator.
+
+    python -m unittest discover tests
+
+"""
+import unittest
+
+from Lego.Datatypes import InputParams
+
+INPUTS = [
+    {'count': 5},
+    {},
+    {'count': 0},
+    {'count': '7'},
+    {'count': 'x'},
+    {'count': True},
+    {'count': 3, 'mode': 'slow'},
+    {'count': 3, 'mode': 'meh'},
+    {'count': 3, 'label': 'a'},
+    {'count': 3, 'label': 5},
+]
+
+def make_params():
+    params = InputParams()
+    params.add_integer_field('count', params.get_integer_range_validation(1, 10), required=True)
+    params.add_string_field('mode', params.get_string_one_of_validate(['fast', 'slow']))
+    params.add_string_field('label', params.get_string_length_validation(2, 4))
+    return params
+
+class InputParamsTest(unittest.TestCase):
+    """
+    The compiled validator agrees with the marshmallow schema it replaces.
+
+    """
+    def test_errors_match_the_schema(self):
+        params = make_params()
+        schema = params.generate_schema('InputParamsTestSchema')()
+        for data in INPUTS:
+            self.assertEqual(params.validate(data), schema.validate(data), data)
+        self.assertEqual(params.validate_many(INPUTS), [schema.validate(data) for data in INPUTS])
+
+    def test_validator_and_schema_follow_new_fields(self):
+        params = make_params()
+        validator = params.compile_validator()
+        schema = params.generate_schema('InputParamsTestSchema')
+        self.assertIs(params.compile_validator(), validator)
+        self.assertIs(params.generate_schema('InputParamsTestSchema'), schema)
+        params.add_integer_field('limit', params.get_integer_range_validation(0, 1), required=True)
+        self.assertIsNot(params.compile_validator(), validator)
+        self.assertIsNot(params.generate_schema('InputParamsTestSchema'), schema)
+        self.assertIn('limit', params.validate({'count': 5}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+Tests of plugin pipelines.
+
+    python -m unittest discover tests
+
+"""
+import unittest
+
+from Lego.Pipeline import Pipeline
+from Lego.PluginBase.PluginBase import PluginBase
+
+GROUP = 'PipelineTest'
+COUNT = 1000
+
+class Stage(PluginBase):
+    """
+    Base of the stages of the test pipelines.
+
+    """
+    def get_chart_configuration(self):
+        return None
+
+    def get_modes_of_operation(self):
+        return ['offline']
+
+class Capture(Stage):
+    def run(self):
+        for value in range(COUNT):
+            yield value
+
+class Decode(Stage):
+    def run(self, inputs):
+        for value in inputs:
+            yield value * 2
+
+class Square(Stage):
+    def run(self, inputs):
+        for value in inputs:
+            yield value * value
+
+class Analyze(Stage):
+    def run(self, inputs):
+        return sum(inputs)
+
+class First(Stage):
+    def run(self, inputs):
+        return next(iter(inputs))
+
+class Chunks(Stage):
+    chunk_size = 3
+
+    def run(self, inputs):
+        return [len(chunk) for chunk in inputs]
+
+class Failing(Stage):
+    def run(self, inputs):
+        for value in inputs:
+            if value > 10:
+                raise RuntimeError('stage failed')
+
+class PipelineTest(unittest.TestCase):
+    """
+    Stages stream through small queues to each other.
+
+    """
+    def setUp(self):
+        self.plugins = [stage(stage.__name__, GROUP) for stage in
+                        (Capture, Decode, Square, Analyze, First, Chunks, Failing)]
+
+    def tearDown(self):
+        for plugin in self.plugins:
+            PluginBase.unregister_plugin(plugin)
+
+    def test_branches_join_and_unread_inputs_are_drained(self):
+        pipeline = (Pipeline(GROUP, queue_size=2, chunk_size=16)
+                    .add_stage('Capture')
+                    .add_stage('Decode', ['Capture'])
+                    .add_stage('Square', ['Capture'])
+                    .add_stage('Analyze', ['Decode', 'Square'])
+                    .add_stage('First', ['Capture']))
+        self.assertEqual(pipeline.get_order(), ['Capture', 'Decode', 'First', 'Square', 'Analyze'])
+        self.assertEqual(pipeline.run(),
+                         {'Analyze': sum(value * 2 + value * value for value in range(COUNT)),
+                          'First': 0})
+
+    def test_plugins_get_chunks_of_their_size(self):
+        pipeline = Pipeline(GROUP, chunk_size=16).add_stage('Capture').add_stage('Chunks',
+                                                                                 ['Capture'])
+        self.assertEqual(pipeline.run(), {'Chunks': [3] * (COUNT // 3) + [COUNT % 3]})
+
+    def test_failing_stage_aborts_the_pipeline(self):
+        pipeline = (Pipeline(GROUP, queue_size=2, chunk_size=4)
+                    .add_stage('Capture')
+                    .add_stage('Failing', ['Capture'])
+                    .add_stage('Analyze', ['Capture']))
+        with self.assertRaises(RuntimeError):
+            pipeline.run()
+
+    def test_cycles_and_duplicates_are_refused(self):
+        pipeline = Pipeline(GROUP).add_stage('Decode', ['Square']).add_stage('Square', ['Decode'])
+        with self.assertRaises(ValueError):
+            pipeline.get_order()
+        with self.assertRaises(ValueError):
+            pipeline.add_stage('Decode')
+
+if __name__ == '__main__':
+    unittest.main()
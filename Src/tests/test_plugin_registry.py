@@ -0,0 +1,66 @@
+"""
+Tests of the plugin registry indexes.
+
+    python -m unittest discover tests
+
+"""
+import unittest
+
+from Lego.PluginBase.PluginRegistry import PluginRegistry
+
+class FakePlugin:
+    """
+    Stands in for a plugin, counts how often its modes are asked.
+
+    """
+    def __init__(self, group, name, modes):
+        self.group = group
+        self.name = name
+        self.modes = modes
+        self.asked = 0
+
+    def get_modes_of_operation(self):
+        self.asked += 1
+        return self.modes
+
+class PluginRegistryTest(unittest.TestCase):
+    """
+    Plugins are found by group, name and mode.
+
+    """
+    def setUp(self):
+        self.registry = PluginRegistry()
+        self.capture = FakePlugin('EventLogs', 'Capture', ['Online', 'online'])
+        self.decode = FakePlugin('EventLogs', 'Decode', ['Offline'])
+        self.other = FakePlugin('Traces', 'Capture', ['online', 'offline'])
+        for plugin in (self.capture, self.decode, self.other):
+            self.registry.register(plugin)
+
+    def test_lookups_use_the_indexes(self):
+        self.assertEqual(self.registry['EventLogs'], [self.capture, self.decode])
+        self.assertIs(self.registry.find('Traces', 'Capture'), self.other)
+        self.assertIsNone(self.registry.find('Traces', 'Decode'))
+        self.assertEqual(self.registry.find_by_name('Capture'), [self.capture, self.other])
+        self.assertEqual(self.registry.find_by_mode('ONLINE'), [self.capture, self.other])
+        self.assertEqual(self.registry.find_by_mode('offline', 'EventLogs'), [self.decode])
+
+    def test_modes_are_asked_once_and_cached(self):
+        self.registry.find_by_mode('online')
+        self.registry.find_by_mode('offline')
+        self.assertEqual(self.registry.get_modes(self.capture), ('online',))
+        self.assertEqual([plugin.asked for plugin in (self.capture, self.decode, self.other)],
+                         [1, 1, 1])
+
+    def test_unregistered_plugins_leave_every_index(self):
+        self.registry.find_by_mode('online')
+        self.registry.unregister(self.capture)
+        self.registry.unregister(self.decode)
+        self.assertNotIn('EventLogs', self.registry)
+        self.assertIsNone(self.registry.find('EventLogs', 'Capture'))
+        self.assertEqual(self.registry.find_by_name('Capture'), [self.other])
+        self.assertEqual(self.registry.find_by_mode('online'), [self.other])
+        self.assertEqual(self.registry.get_modes(self.capture), ())
+        self.registry.unregister(self.capture)
+
+if __name__ == '__main__':
+    unittest.main()
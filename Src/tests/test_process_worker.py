@@ -0,0 +1,71 @@
+"""
+Tests of plugins run in worker processes.
+
+    python -m unittest discover tests
+
+"""
+import os
+import time
+import unittest
+import multiprocessing
+
+from Lego.Datatypes import RuntimeMonitorParams
+from Lego.PluginBase.PluginBase import PluginBase
+from Lego.PluginBase.ProcessWorker import ProcessWorker
+
+class CountingPlugin(PluginBase):
+    """
+    Yields a counter with the same value repeated in an array.
+
+    """
+    COUNT = 12
+
+    def get_chart_configuration(self):
+        return None
+
+    def get_modes_of_operation(self):
+        return ['offline']
+
+    def run(self):
+        for value in range(self.COUNT):
+            yield (value, [float(value)] * 4)
+
+@unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), 'needs fork')
+class ProcessWorkerTest(unittest.TestCase):
+    """
+    A worker streams its outputs through a ring smaller than the outputs.
+
+    """
+    def setUp(self):
+        self.plugin = CountingPlugin('Counting', 'ProcessWorkerTest')
+        self.monitor = RuntimeMonitorParams()
+        self.monitor.add_unsigned_integer_field('value')
+        self.monitor.add_array_field('samples', 'double', 4)
+        self.worker = ProcessWorker(self.plugin, self.monitor, 'worker' + str(os.getpid()),
+                                    capacity=4, chunk_size=2)
+
+    def tearDown(self):
+        self.worker.close(5)
+        PluginBase.unregister_plugin(self.plugin)
+
+    def read_all(self):
+        outputs = []
+        deadline = time.monotonic() + 10
+        while len(outputs) < CountingPlugin.COUNT and time.monotonic() < deadline:
+            self.worker.wait_for_data(0.1)
+            outputs.extend(self.worker.read())
+        return outputs
+
+    def test_outputs_outlive_their_ring_slots(self):
+        self.worker.start()
+        outputs = self.read_all()
+        # Reused slots must not show through the outputs already read.
+        channel = self.worker.channel
+        channel.sharedmem[channel.meta.size_of_meta():] = bytes(channel.size -
+                                                                 channel.meta.size_of_meta())
+        self.assertEqual([(value, list(samples)) for value, samples in outputs],
+                         [(value, [float(value)] * 4) for value in range(CountingPlugin.COUNT)])
+        self.assertEqual(self.worker.read(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+Tests of RuntimeMonitorBatch columns and rows.
+
+    python -m unittest discover tests
+
+"""
+import os
+import array
+import itertools
+import unittest
+
+from Lego.Datatypes import RuntimeMonitorBatch, RuntimeMonitorParams, StringColumn
+from Lego.Ipc import ShmemRing
+
+TASKIDS = itertools.count(os.getpid() * 1000 + 800)
+
+def make_monitor():
+    monitor = RuntimeMonitorParams()
+    monitor.add_string_field('name', 8)
+    monitor.add_signed_integer_field('score')
+    monitor.add_double_field('ratio')
+    return monitor
+
+def make_objects(count):
+    return [('n' + str(value), value - 2, value / 2) for value in range(count)]
+
+class RuntimeMonitorBatchTest(unittest.TestCase):
+    """
+    Batches hold serialized objects field by field.
+
+    """
+    def setUp(self):
+        self.monitor = make_monitor()
+
+    def test_rows_read_their_fields_from_the_columns(self):
+        objs = make_objects(5)
+        batch = self.monitor.deserialize_batch(b''.join(map(self.monitor.serialize, objs)))
+        self.assertEqual(len(batch), 5)
+        self.assertIsInstance(batch.get_column('score'), array.array)
+        self.assertIsInstance(batch.get_column('name'), StringColumn)
+        self.assertEqual(list(batch.get_column('score')), [obj[1] for obj in objs])
+        self.assertEqual((batch[1].name, batch[1].score, batch[1].ratio), objs[1])
+        self.assertEqual(batch[-1].materialize(), objs[-1])
+        self.assertEqual([row.materialize() for row in batch[1:3]], objs[1:3])
+        self.assertEqual(batch.get_record(2), self.monitor.deserialize(
+            self.monitor.serialize(objs[2])))
+        with self.assertRaises(IndexError):
+            batch[5]
+
+    def test_columns_cost_about_the_size_of_the_records(self):
+        batch = self.monitor.deserialize_batch(
+            b''.join(map(self.monitor.serialize, make_objects(100))))
+        self.assertEqual(batch.nbytes(), 100 * (8 + batch.get_column('score').itemsize + 8))
+
+    def test_appended_objects_are_padded_like_serialized_ones(self):
+        batch = RuntimeMonitorBatch(self.monitor)
+        batch.append(('a' * 12, 1, 1.0))
+        batch.append((b'b', 2, 2.0))
+        self.assertEqual(batch.get_column('name').get_bytes(1), b'b'.ljust(8, b'\0'))
+        self.assertEqual([row.materialize() for row in batch], [('a' * 8, 1, 1.0), ('b', 2, 2.0)])
+
+    def test_records_of_a_wrapped_ring_are_decoded_in_order(self):
+        taskid = next(TASKIDS)
+        writer = ShmemRing(taskid, self.monitor.get_size(), capacity=4)
+        reader = ShmemRing(taskid, self.monitor.get_size(), child=False)
+        try:
+            objs = make_objects(7)
+            writer.append_many(map(self.monitor.serialize, objs[:3]))
+            reader.read_views()
+            writer.append_many(map(self.monitor.serialize, objs[3:]))
+            views = reader.read_views()
+            self.assertEqual(len(views.get_chunks()), 2)
+            batch = RuntimeMonitorBatch(self.monitor)
+            batch.BLOCK_SIZE = 3
+            self.assertEqual([row.materialize() for row in batch.extend(views)], objs[3:])
+            del views
+        finally:
+            reader.close()
+            writer.close()
+            ShmemRing.unlink(taskid)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Tests of the RuntimeMonitorParams codec and of bulk NumPy decoding.
+
+    python -m unittest discover tests
+
+"""
+import os
+import struct
+import itertools
+import unittest
+
+from Lego.Datatypes import RuntimeMonitorParams
+from Lego.Ipc import ShmemRing
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TASKIDS = itertools.count(os.getpid() * 1000 + 700)
+
+def make_monitor(byte_order='NATIVE'):
+    monitor = RuntimeMonitorParams(byte_order)
+    monitor.add_string_field('name', 8)
+    monitor.add_signed_integer_field('score')
+    monitor.add_double_field('ratio')
+    return monitor
+
+class RuntimeMonitorCodecTest(unittest.TestCase):
+    """
+    Objects go through the compiled codec and back.
+
+    """
+    def test_round_trip_cuts_strings_at_their_padding(self):
+        monitor = make_monitor()
+        data = monitor.serialize(('kush', -3, 0.5))
+        self.assertEqual(data, struct.pack('@8sid', b'kush', -3, 0.5))
+        obj = monitor.deserialize(data)
+        self.assertEqual(obj, ('kush', -3, 0.5))
+        self.assertEqual((obj.name, obj.score, obj.ratio), ('kush', -3, 0.5))
+
+    def test_sizes_follow_the_byte_order(self):
+        self.assertEqual(make_monitor().get_size(), struct.calcsize('@8sid'))
+        self.assertEqual(make_monitor('LITTLE-ENDIAN').get_size(), struct.calcsize('<8sid'))
+        monitor = make_monitor('BIG-ENDIAN')
+        self.assertEqual(monitor.serialize(('a', 1, 1.0)), struct.pack('>8sid', b'a', 1, 1.0))
+
+    def test_objects_are_unpacked_in_place_at_an_offset(self):
+        monitor = make_monitor()
+        buffer = bytearray(4 + 2 * monitor.get_size())
+        monitor.serialize_into(buffer, 4, ('first', 1, 1.0))
+        monitor.serialize_into(buffer, 4 + monitor.get_size(), ('second', 2, 2.0))
+        self.assertEqual(monitor.deserialize(memoryview(buffer), 4 + monitor.get_size()),
+                         ('second', 2, 2.0))
+        self.assertEqual(list(monitor.iter_deserialize(memoryview(buffer)[4:])),
+                         [('first', 1, 1.0), ('second', 2, 2.0)])
+
+    def test_adding_a_field_compiles_a_new_codec(self):
+        monitor = make_monitor()
+        codec = monitor.compile()
+        monitor.add_unsigned_integer_field('count')
+        self.assertIsNot(monitor.compile(), codec)
+        self.assertEqual(monitor.deserialize(monitor.serialize(('a', 1, 1.0, 7))).count, 7)
+
+    def test_layout_survives_a_round_trip(self):
+        monitor = make_monitor('LITTLE-ENDIAN')
+        data = monitor.serialize(('kush', -3, 0.5))
+        copy = RuntimeMonitorParams.from_layout(monitor.get_layout())
+        self.assertEqual(copy.get_size(), monitor.get_size())
+        self.assertEqual(copy.deserialize(data), ('kush', -3, 0.5))
+
+    def test_objects_with_missing_fields_are_refused(self):
+        with self.assertRaises(ValueError):
+            make_monitor().serialize(('a', 1))
+
+@unittest.skipIf(numpy is None, 'needs numpy')
+class NumpyDeserializationTest(unittest.TestCase):
+    """
+    Buffers of objects decode to structured arrays in bulk.
+
+    """
+    def test_array_fields_match_the_objects(self):
+        monitor = make_monitor()
+        objs = [('n' + str(value), value - 2, value / 2) for value in range(5)]
+        array = monitor.deserialize_many(b''.join(map(monitor.serialize, objs)))
+        self.assertEqual(monitor.get_numpy_dtype().itemsize, monitor.get_size())
+        self.assertEqual(list(array['name']), [obj[0].encode() for obj in objs])
+        self.assertEqual(list(array['score']), [obj[1] for obj in objs])
+        self.assertEqual(list(array['ratio']), [obj[2] for obj in objs])
+
+    def test_records_of_a_wrapped_ring_are_joined(self):
+        monitor = make_monitor()
+        taskid = next(TASKIDS)
+        writer = ShmemRing(taskid, monitor.get_size(), capacity=4)
+        reader = ShmemRing(taskid, monitor.get_size(), child=False)
+        try:
+            writer.append_many([monitor.serialize(('a', value, 0.0)) for value in range(3)])
+            reader.read_views()
+            writer.append_many([monitor.serialize(('a', value, 0.0)) for value in range(3, 6)])
+            array = monitor.deserialize_many(reader.read_views())
+            self.assertEqual(list(array['score']), [3, 4, 5])
+            del array
+        finally:
+            reader.close()
+            writer.close()
+            ShmemRing.unlink(taskid)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,271 @@
+"""
+Tests of Shmem segment sizes, shared writers and reader wakeups.
+
+    python -m unittest discover tests
+
+"""
+import os
+import time
+import struct
+import itertools
+import threading
+import unittest
+import multiprocessing
+from collections import Counter
+
+from Lego.Ipc import Shmem
+from Lego.Ipc.Shmem import PENDING_TAG, FRAME_SIZE, FRAME_TAG_OFFSET, _ShmemMeta
+
+TASKIDS = itertools.count(os.getpid() * 1000)
+
+class ShmemTestCase(unittest.TestCase):
+    """
+    Closes and unlinks the segments a test opened.
+
+    """
+    def setUp(self):
+        self.taskid = next(TASKIDS)
+        self.opened = []
+
+    def tearDown(self):
+        for shmem in reversed(self.opened):
+            shmem.close()
+        Shmem.unlink(self.taskid)
+
+    def open(self, *args, **kwargs):
+        shmem = Shmem(self.taskid, *args, **kwargs)
+        self.opened.append(shmem)
+        return shmem
+
+    @staticmethod
+    def reserve_pending(shmem, size):
+        # Reserve a frame like _append_shared does and leave it pending.
+        with shmem._lock_segment():
+            shmem.meta.from_bytes(shmem.sharedmem[0:_ShmemMeta.HEADER_SIZE])
+            offset = shmem._reserve_frame(size, PENDING_TAG)
+            shmem._write_meta()
+        return offset
+
+class SegmentSizeTest(ShmemTestCase):
+    """
+    Readers map the segment as large as the writer made it.
+
+    """
+    def test_reader_maps_the_writer_size(self):
+        writer = self.open(size=4096)
+        reader = self.open(child=False)
+        self.assertEqual(reader.size, 4096)
+        self.assertEqual(os.path.getsize(writer.path), 4096)
+
+    def test_reader_needs_a_writer(self):
+        with self.assertRaises(FileNotFoundError):
+            Shmem(self.taskid, child=False)
+        self.assertFalse(os.path.exists(Shmem.get_path(self.taskid)))
+
+    def test_reader_follows_a_growing_writer(self):
+        writer = self.open(size=4096, growable=True)
+        reader = self.open(child=False)
+        for value in range(300):
+            writer.append_shmem(struct.pack('@Q', value) * 5)
+        self.assertEqual(writer.size, 16384)
+        self.assertEqual(os.path.getsize(writer.path), writer.size)
+        objs = reader.read_shmem()
+        self.assertEqual(reader.size, writer.size)
+        self.assertEqual([struct.unpack_from('@Q', obj)[0] for obj in objs], list(range(300)))
+
+    def test_writer_without_room_fails(self):
+        writer = self.open(size=Shmem.size_for(8, 2))
+        writer.append_many([bytes(8)] * 2)
+        with self.assertRaises(ValueError):
+            writer.append_shmem(bytes(8))
+
+    def test_failed_batch_is_not_published(self):
+        writer = self.open(size=Shmem.size_for(8, 2))
+        reader = self.open(child=False)
+        with self.assertRaises(ValueError):
+            writer.append_many([bytes([value]) * 8 for value in range(3)])
+        self.assertEqual(reader.read_shmem(), [])
+        writer.append_shmem(b'after')
+        self.assertEqual(reader.read_shmem(), [b'after'])
+
+    def test_failed_batch_keeps_the_grown_segment(self):
+        writer = self.open(size=4096, growable=True)
+        reader = self.open(child=False)
+
+        def objs():
+            yield bytes(3000)
+            yield bytes(3000)
+            raise RuntimeError('producer failed')
+
+        with self.assertRaises(RuntimeError):
+            writer.append_many(objs())
+        writer.append_many([bytes(3000), bytes(3000), b'after'])
+        self.assertEqual(writer.size, 8192)
+        self.assertEqual([len(obj) for obj in reader.read_shmem()], [3000, 3000, 5])
+        self.assertEqual(reader.size, writer.size)
+
+    def test_unlink_removes_the_segment_and_its_pipe(self):
+        writer = self.open()
+        reader = self.open(child=False)
+        reader.wait_for_data(0)
+        self.assertTrue(os.path.exists(writer.path + '.notify'))
+        Shmem.unlink(self.taskid)
+        self.assertFalse(os.path.exists(writer.path))
+        self.assertFalse(os.path.exists(writer.path + '.notify'))
+
+class HeaderGenerationTest(ShmemTestCase):
+    """
+    Readers only trust headers copied while their generation stayed even.
+
+    """
+    def test_reader_gives_up_on_a_header_left_half_written(self):
+        writer = self.open()
+        reader = self.open(child=False)
+        writer.append_shmem(b'first')
+        # The writer died while writing the header.
+        generation = struct.unpack_from('@Q', writer.sharedmem, 0)[0]
+        struct.pack_into('@Q', writer.sharedmem, 0, generation + 1)
+        reader.HEADER_TIMEOUT = 0.1
+        started = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            reader.read_shmem()
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        # The next header update starts from the odd generation.
+        writer.meta.generation = generation + 1
+        writer.append_shmem(b'second')
+        self.assertEqual(reader.read_shmem(), [b'first', b'second'])
+
+def _append_shared(taskid, writer, count):
+    shmem = Shmem(taskid, shared_writers=True, growable=True, size=4096, size_of_index=64)
+    for value in range(0, count, 4):
+        if value % 8:
+            shmem.append_shmem(struct.pack('@II', writer, value))
+        else:
+            shmem.append_many([struct.pack('@II', writer, value + offset) for offset in range(4)])
+    shmem.close()
+
+@unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), 'needs fork')
+class SharedWritersTest(ShmemTestCase):
+    """
+    Several processes append to one growing segment.
+
+    """
+    WRITERS = 4
+    COUNT = 2000
+
+    def test_writers_in_other_processes_lose_nothing(self):
+        self.open(shared_writers=True, growable=True, size=4096, size_of_index=64)
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_append_shared, args=(self.taskid, writer, self.COUNT))
+                     for writer in range(self.WRITERS)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+        reader = self.open(child=False)
+        objs = [struct.unpack('@II', obj) for obj in reader.read_shmem()]
+        expected = self.COUNT // 2 + self.COUNT // 8
+        self.assertEqual(Counter(writer for writer, _ in objs),
+                         {writer: expected for writer in range(self.WRITERS)})
+        self.assertEqual(len(set(objs)), len(objs))
+        self.assertGreater(reader.size, 4096)
+        self.assertEqual(bytes(reader.read_record(10)), struct.pack('@II', *objs[10]))
+
+    def test_read_record_skips_pending_frames(self):
+        pending = self.open(shared_writers=True, size_of_index=8)
+        other = self.open(shared_writers=True)
+        reader = self.open(child=False)
+        other.append_shmem(b'first')
+        self.reserve_pending(pending, 7)
+        other.append_shmem(b'second')
+        self.assertEqual(bytes(reader.read_record(1)), b'second')
+        with self.assertRaises(IndexError):
+            reader.read_record(2)
+        # Unlike read_views, read_record leaves the objects to wait for.
+        self.assertTrue(reader.wait_for_data(0))
+        self.assertEqual([bytes(obj) for obj in reader.read_views()], [b'first', b'second'])
+
+    def test_segment_of_a_single_writer_needs_a_reset(self):
+        self.open().close()
+        self.opened.clear()
+        with self.assertRaises(ValueError):
+            Shmem(self.taskid, shared_writers=True)
+        first = self.open(shared_writers=True, reset=True)
+        second = self.open(shared_writers=True)
+        first.append_shmem(b'first')
+        second.append_shmem(b'second')
+        self.assertEqual(self.open(child=False).read_shmem(), [b'first', b'second'])
+
+class WaitForDataTest(ShmemTestCase):
+    """
+    Readers waiting for data wake up once it is committed.
+
+    """
+    def wait_in_thread(self, reader, timeout=5):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(reader.wait_for_data(timeout)))
+        thread.start()
+        # Let the reader block on the notification pipe.
+        time.sleep(0.1)
+        return thread, results
+
+    def test_times_out_without_data(self):
+        self.open()
+        reader = self.open(child=False)
+        started = time.monotonic()
+        self.assertFalse(reader.wait_for_data(0.1))
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+    def test_returns_at_once_for_data_not_read_yet(self):
+        writer = self.open()
+        reader = self.open(child=False)
+        writer.append_shmem(b'ready')
+        self.assertTrue(reader.wait_for_data(0))
+        reader.read_views()
+        self.assertFalse(reader.wait_for_data(0))
+
+    def test_wakes_up_on_append(self):
+        writer = self.open()
+        reader = self.open(child=False)
+        self.assertIsNone(writer.notify_fd)
+        thread, results = self.wait_in_thread(reader)
+        writer.append_shmem(b'wake up')
+        thread.join()
+        self.assertEqual(results, [True])
+        self.assertIsNotNone(writer.notify_fd)
+
+    def test_writer_opens_the_pipe_only_for_waiting_readers(self):
+        writer = self.open()
+        writer.append_shmem(b'nobody waits')
+        self.assertIsNone(writer.notify_fd)
+        reader = self.open(child=False)
+        reader.wait_for_data(0)
+        writer.append_shmem(b'somebody waits')
+        self.assertIsNotNone(writer.notify_fd)
+        reader.close()
+        self.opened.remove(reader)
+        self.assertEqual(struct.unpack_from('@Q', writer.sharedmem,
+                                            _ShmemMeta.READERS_OFFSET)[0], 0)
+
+    def test_wakes_up_when_a_pending_frame_commits(self):
+        pending = self.open(shared_writers=True)
+        other = self.open(shared_writers=True)
+        reader = self.open(child=False)
+        offset = self.reserve_pending(pending, 7)
+        other.append_shmem(b'other')
+        self.assertEqual(reader.read_shmem(), [b'other'])
+        thread, results = self.wait_in_thread(reader)
+        pending.sharedmem[offset + FRAME_SIZE:offset + FRAME_SIZE + 7] = b'pending'
+        struct.pack_into('@I', pending.sharedmem, offset + FRAME_TAG_OFFSET, 0)
+        with pending._lock_segment():
+            pending.meta.from_bytes(pending.sharedmem[0:_ShmemMeta.HEADER_SIZE])
+            pending.meta.committed_objects += 1
+            pending._write_meta()
+        pending._notify()
+        thread.join()
+        self.assertEqual(results, [True])
+        self.assertEqual(reader.read_shmem(), [b'pending', b'other'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+"""
+Tests of the ShmemRing lap and torn record detection.
+
+    python -m unittest discover tests
+
+"""
+import os
+import struct
+import itertools
+import unittest
+import multiprocessing
+
+from Lego.Ipc import ShmemRing
+from Lego.Ipc.ShmemRing import _ShmemRingMeta
+
+TASKIDS = itertools.count(os.getpid() * 1000 + 500)
+RECORD_SIZE = 8
+
+def record(value):
+    return bytes([value % 256]) * RECORD_SIZE
+
+def values(records):
+    return [bytes(obj)[0] for obj in records]
+
+class ShmemRingTest(unittest.TestCase):
+    """
+    Single writer and reader of a ring of four records.
+
+    """
+    CAPACITY = 4
+
+    def setUp(self):
+        self.taskid = next(TASKIDS)
+        self.writer = ShmemRing(self.taskid, RECORD_SIZE, capacity=self.CAPACITY)
+        self.reader = ShmemRing(self.taskid, RECORD_SIZE, child=False)
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.close()
+        ShmemRing.unlink(self.taskid)
+
+    def test_reads_records_in_order(self):
+        for value in range(3):
+            self.writer.append_shmem(record(value))
+        self.assertEqual(values(self.reader.read_shmem()), [0, 1, 2])
+        self.assertEqual(self.reader.read_shmem(), [])
+        self.assertEqual(self.reader.get_overruns(), 0)
+
+    def test_full_ring_keeps_every_record(self):
+        for value in range(self.CAPACITY):
+            self.writer.append_shmem(record(value))
+        self.assertEqual(values(self.reader.read_shmem()), [0, 1, 2, 3])
+        self.assertEqual(self.reader.get_overruns(), 0)
+
+    def test_lapped_records_are_counted_as_overruns(self):
+        for value in range(self.CAPACITY + 2):
+            self.writer.append_shmem(record(value))
+        self.assertEqual(values(self.reader.read_shmem()), [2, 3, 4, 5])
+        self.assertEqual(self.reader.get_overruns(), 2)
+
+    def test_records_overwritten_while_copied_are_dropped(self):
+        for value in range(self.CAPACITY):
+            self.writer.append_shmem(record(value))
+        slot_offset = self.reader._slot_offset
+
+        def lap_once(sequence):
+            # The writer laps the reader right after it started copying.
+            if sequence == 1:
+                self.writer.append_many([record(value) for value in range(10, 12)])
+            return slot_offset(sequence)
+
+        self.reader._slot_offset = lap_once
+        self.assertEqual(values(self.reader.read_shmem()), [2, 3])
+        self.assertEqual(self.reader.get_overruns(), 2)
+
+    def test_reader_lapped_after_loading_head_keeps_its_tail(self):
+        for value in range(self.CAPACITY):
+            self.writer.append_shmem(record(value))
+        load_counter = self.reader._load_counter
+
+        def lap_after_head(offset):
+            value = load_counter(offset)
+            # The writer laps the reader between its loads of head and reserved.
+            if offset == _ShmemRingMeta.HEAD_OFFSET and value == self.CAPACITY:
+                self.writer.append_many([record(value) for value in range(4, 14)])
+            return value
+
+        self.reader._load_counter = lap_after_head
+        self.assertEqual(self.reader.read_shmem(), [])
+        self.assertEqual(values(self.reader.read_shmem()), [10, 11, 12, 13])
+        self.assertEqual(self.reader.get_overruns(), 10)
+
+    def test_records_in_reserved_slots_are_dropped(self):
+        for value in range(self.CAPACITY):
+            self.writer.append_shmem(record(value))
+        slot_offset = self.reader._slot_offset
+
+        def reserve_once(sequence):
+            # The writer reserved the slot of the oldest record and copies over it, before
+            # publishing the new head.
+            if sequence == 1:
+                self.writer._store_counter(_ShmemRingMeta.RESERVED_OFFSET, self.CAPACITY + 1)
+            return slot_offset(sequence)
+
+        self.reader._slot_offset = reserve_once
+        self.assertEqual(values(self.reader.read_shmem()), [1, 2, 3])
+        self.assertEqual(self.reader.get_overruns(), 1)
+
+    def test_batch_larger_than_ring_keeps_its_last_records(self):
+        self.assertEqual(self.writer.append_many([record(value) for value in range(6)]), 6)
+        self.assertEqual(values(self.reader.read_shmem()), [2, 3, 4, 5])
+        self.assertEqual(self.reader.get_overruns(), 2)
+
+    def test_writer_without_overwrite_waits_for_the_reader(self):
+        writer = ShmemRing(self.taskid, RECORD_SIZE, overwrite=False, capacity=self.CAPACITY,
+                           resume=True)
+        try:
+            self.assertEqual(writer.append_many([record(value) for value in range(6)]),
+                             self.CAPACITY)
+            self.assertFalse(writer.append_shmem(record(6)))
+            self.assertEqual(values(self.reader.read_shmem()), [0, 1, 2, 3])
+            self.assertEqual(self.reader.get_overruns(), 0)
+            self.assertTrue(writer.append_shmem(record(6)))
+        finally:
+            writer.close()
+
+def _append_sequence(writer, count):
+    for sequence in range(count):
+        writer.append_shmem(struct.pack('@QQ', sequence, sequence))
+
+@unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), 'needs fork')
+class ShmemRingProcessTest(unittest.TestCase):
+    """
+    A writer in another process laps a reader of a small ring.
+
+    """
+    COUNT = 100000
+
+    def test_every_record_is_received_or_counted_as_overrun(self):
+        taskid = next(TASKIDS)
+        writer = ShmemRing(taskid, 16, capacity=4)
+        reader = ShmemRing(taskid, 16, child=False)
+        try:
+            process = multiprocessing.get_context('fork').Process(
+                target=_append_sequence, args=(writer, self.COUNT))
+            process.start()
+            received = []
+            while process.is_alive():
+                received.extend(struct.unpack('@QQ', obj) for obj in reader.read_shmem())
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+            received.extend(struct.unpack('@QQ', obj) for obj in reader.read_shmem())
+        finally:
+            reader.close()
+            writer.close()
+            ShmemRing.unlink(taskid)
+        sequences = [first for first, second in received if first == second]
+        self.assertEqual(len(sequences), len(received))
+        self.assertTrue(all(first < second for first, second in zip(sequences, sequences[1:])))
+        self.assertEqual(sequences[-1], self.COUNT - 1)
+        self.assertEqual(len(received) + reader.get_overruns(), self.COUNT)
+
+if __name__ == '__main__':
+    unittest.main()